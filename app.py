@@ -1,145 +1,32 @@
 import os
-import pandas as pd
+import threading
+import zlib
+from urllib.parse import urlencode
+
 import numpy as np
-import colorsys
+import pandas as pd
 
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, ctx, dcc, html, Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import plotly.express as px
 import plotly.graph_objects as go
+from flask import Response, abort, request, stream_with_context
+from flask_compress import Compress
+
+from backends import MAX_SCENARIOS, QUERY_BACKEND, hotspot_cols, injury_cols
+from data import DataStore
+from drilldown import SessionSelections, drill_key, refine_all
+from export import EXPORT_CHUNK_ROWS, export_columns, export_formats, iter_csv, iter_parquet
+from lttb import lttb
+from queries import HOTSPOT_COUNT, PRECOMPUTED_RESULTS, filter_key, summarize_selection
+from singleflight import LatestRequests, SingleFlight, Superseded
 
 # ======================
-# 1. DATA LOADING & PREP
+# 1. DATA LOADING (background)
 # ======================
-df = pd.read_csv("Motor_Vehicle_Collisions_Crashes.csv", low_memory=False)
-
-df["CRASH_HOUR"] = pd.to_datetime(df["CRASH TIME"], format="%H:%M", errors="coerce").dt.hour
-df = df.dropna(subset=["LATITUDE", "LONGITUDE"])
-
-df["TOTAL_INJURED"] = df["NUMBER OF PERSONS INJURED"].fillna(0)
-df["TOTAL_KILLED"] = df["NUMBER OF PERSONS KILLED"].fillna(0)
-
-factor_cols = [
-    "CONTRIBUTING FACTOR VEHICLE 1",
-    "CONTRIBUTING FACTOR VEHICLE 2",
-    "CONTRIBUTING FACTOR VEHICLE 3",
-    "CONTRIBUTING FACTOR VEHICLE 4",
-    "CONTRIBUTING FACTOR VEHICLE 5",
-]
-
-# Short label mapping for contributing factors
-factor_mapping = {
-    "Accelerator Defective": "Accel Defect",
-    "Aggressive Driving/Road Rage": "Aggressive/Road Rage",
-    "Alcohol Involvement": "Alcohol",
-    "Animals Action": "Animals",
-    "Backing Unsafely": "Backing Unsafe",
-    "Brakes Defective": "Brake Defect",
-    "Cell Phone (hand-Held)": "Phone (Handheld)",
-    "Cell Phone (hands-free)": "Phone (Hands-free)",
-    "Driver Inattention/Distraction": "Driver Distracted",
-    "Driver Inexperience": "Inexperienced",
-    "Driverless/Runaway Vehicle": "Runaway Vehicle",
-    "Drugs (illegal)": "Drugs",
-    "Eating or Drinking": "Eating/Drinking",
-    "Failure to Keep Right": "Didn't Keep Right",
-    "Failure to Yield Right-of-Way": "Didn't Yield",
-    "Fatigued/Drowsy": "Fatigued",
-    "Fell Asleep": "Fell Asleep",
-    "Following Too Closely": "Tailgating",
-    "Glare": "Glare",
-    "Headlights Defective": "Headlight Defect",
-    "Illnes": "Illness",
-    "Lane Marking Improper/Inadequate": "Bad Lane Markings",
-    "Listening/Using Headphones": "Using Headphones",
-    "Lost Consciousness": "Lost Consciousness",
-    "Obstruction/Debris": "Obstruction",
-    "Other Electronic Device": "Other Device",
-    "Other Lighting Defects": "Lighting Defect",
-    "Other Vehicular": "Other Vehicular",
-    "Outside Car Distraction": "Outside Distract.",
-    "Oversized Vehicle": "Oversized",
-    "Passenger Distraction": "Passenger Distract.",
-    "Passing Too Closely": "Close Passing",
-    "Passing or Lane Usage Improper": "Bad Lane Use",
-    "Pavement Defective": "Pavement Defect",
-    "Pavement Slippery": "Slippery Pavement",
-    "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion": "Ped/Bike Conf.",
-    "Physical Disability": "Disability",
-    "Prescription Medication": "Medication",
-    "Reaction to Uninvolved Vehicle": "Reacted to Other",
-    "Shoulders Defective/Improper": "Bad Shoulder",
-    "Steering Failure": "Steering Failure",
-    "Texting": "Texting",
-    "Tinted Windows": "Tinted",
-    "Tire Failure/Inadequate": "Tire Failure",
-    "Tow Hitch Defective": "Tow Hitch",
-    "Traffic Control Device Improper/Non-Working": "Bad Signal",
-    "Traffic Control Disregarded": "Ignored Signal",
-    "Turning Improperly": "Bad Turn",
-    "Unsafe Lane Changing": "Unsafe Lane Change",
-    "Unsafe Speed": "Unsafe Speed",
-    "Using On Board Navigation Device": "Using Nav",
-    "Vehicle Vandalism": "Vandalism",
-    "View Obstructed/Limited": "View Blocked",
-    "Windshield Inadequate": "Bad Windshield",
-}
-
-df["TOP_FACTOR"] = df[factor_cols].bfill(axis=1).iloc[:, 0]
-df["TOP_FACTOR_SHORT"] = df["TOP_FACTOR"].map(factor_mapping).fillna(df["TOP_FACTOR"])
-
-vehicle_cols = [
-    "VEHICLE TYPE CODE 1",
-    "VEHICLE TYPE CODE 2",
-    "VEHICLE TYPE CODE 3",
-    "VEHICLE TYPE CODE 4",
-    "VEHICLE TYPE CODE 5",
-]
-vehicle_types = sorted(list({v for col in vehicle_cols for v in df[col].dropna().unique()}))
-borough_options = sorted(df["BOROUGH"].dropna().unique())
-
-def classify_vehicle(v):
-    if pd.isna(v):
-        return "other"
-    
-    v_low = str(v).lower().strip()
-
-    # MOTORCYCLE CATEGORY
-    motorcycle_keywords = [
-        "motorcycle", "motorbike", "scooter", "moped", "dirt", "bike",
-        "bicycle", "citibike", "mini", "hover", "skate", "unic", "one wheel",
-        "e-bike", "ebike", "e bike", "e-scooter", "escooter", "e scooter",
-        "kick", "stand", "razor"
-    ]
-    if any(k in v_low for k in motorcycle_keywords):
-        return "motorcycle"
-
-    # TRUCK CATEGORY
-    truck_keywords = [
-        "truck", "van", "bus", "ambul", "fire", "fdny", "usps", "box",
-        "freight", "dump", "tractor", "semi", "delivery", "tow",
-        "sweep", "cement", "mixer", "fork", "lift", "backhoe",
-        "construction", "cargo", "commercial", "flat", "pick", "pickup",
-        "uhaul", "sanitation", "loader", "bobcat", "plow", "snow",
-        "armored", "atv", "toolcat"
-    ]
-    if any(k in v_low for k in truck_keywords):
-        return "truck"
-
-    # TRUE CAR CATEGORY (strict definitions)
-    car_keywords = [
-        "sedan", "station wagon", "sport utility", "suv", "suburban",
-        "passenger", "4 dr", "2 dr", "coupe", "convertible", "hatch",
-        "minivan", "wagon"
-    ]
-    if any(k in v_low for k in car_keywords):
-        return "car"
-
-    # EVERYTHING ELSE → OTHER
-    return "other"
-
-for col in vehicle_cols:
-    df[col + "_CATEGORY"] = df[col].apply(classify_vehicle)
+# The CSV takes a long time to parse, so it is loaded off the import path:
+# gunicorn can bind and answer health checks while the dataset warms up.
+store = DataStore(backend=QUERY_BACKEND, precomputed=PRECOMPUTED_RESULTS).start()
 
 # ======================
 # 2. APP & LAYOUT
@@ -293,428 +180,606 @@ kpi_card = {
 
 title_style = {"fontSize": "22px", "fontWeight": "600"}
 
-app.layout = dbc.Container(
-    fluid=True,
-    style=gradient_bg,
-    children=[
+def header_row():
+    return dbc.Row(
+        dbc.Col(
+            html.Div(
+                [
+                    html.Div(
+                        "NYC Motor Vehicle Crashes Dashboard",
+                        style={
+                            "fontSize": "34px",
+                            "fontWeight": "800",
+                            "letterSpacing": "1px",
+                            "background": "linear-gradient(90deg, #b91c1c, #f87171)",
+                            "-webkit-background-clip": "text",
+                            "color": "transparent",
+                            "textAlign": "center",
+                            "marginBottom": "4px",
+                        }
+                    ),
+                    html.Div(
+                        "INSIGHTS ON CRASHES, INJURIES & RISK FACTORS",
+                        style={
+                            "fontSize": "14px",
+                            "fontWeight": "700",
+                            "color": "#555",
+                            "textAlign": "center",
+                            "marginTop": "-6px",
+                            "letterSpacing": "2px",
+                        }
+                    ),
+                ]
+            ),
+            width=12
+        ),
+        className="mb-4"
+    )
+
+
+def dashboard_layout(borough_options, vehicle_types):
+    return dbc.Container(
+        fluid=True,
+        style=gradient_bg,
+        children=[
+
+            # ======================
+            # HEADER
+            # ======================
+            header_row(),
 
-        # ======================
-        # HEADER
-        # ======================
-        dbc.Row(
-            dbc.Col(
+            # ======================
+            # FILTERS (Horizontal)
+            # ======================
+            dbc.Card(
                 html.Div(
                     [
+                        # Borough
                         html.Div(
-                            "NYC Motor Vehicle Crashes Dashboard",
-                            style={
-                                "fontSize": "34px",
-                                "fontWeight": "800",
-                                "letterSpacing": "1px",
-                                "background": "linear-gradient(90deg, #b91c1c, #f87171)",
-                                "-webkit-background-clip": "text",
-                                "color": "transparent",
-                                "textAlign": "center",
-                                "marginBottom": "4px",
-                            }
+                            [
+                                html.Label("Borough", style={"fontWeight": "600", "fontSize": "12px"}),
+                                dcc.Dropdown(
+                                    id="borough-filter",
+                                    options=[{"label": b, "value": b} for b in borough_options],
+                                    multi=True,
+                                    placeholder="Select borough(s)",
+                                    style={"minWidth": "180px"}
+                                ),
+                            ],
+                            style={"display": "flex", "flexDirection": "column", "gap": "4px"}
                         ),
+            
+                        # Hour Slider
                         html.Div(
-                            "INSIGHTS ON CRASHES, INJURIES & RISK FACTORS",
+                            [
+                                html.Label("Hour of Day", style={"fontWeight": "600", "fontSize": "12px"}),
+                                dcc.RangeSlider(
+                                    id="hour-filter",
+                                    min=0,
+                                    max=23,
+                                    step=1,
+                                    value=[0, 23],
+                                    marks={
+                                        0: "12am",
+                                        6: "6am",
+                                        12: "12pm",
+                                        18: "6pm",
+                                        23: "11pm",
+                                    },
+                                    tooltip={"placement": "bottom", "always_visible": False},
+                                    allowCross=False,
+                                ),
+                            ],
                             style={
-                                "fontSize": "14px",
-                                "fontWeight": "700",
-                                "color": "#555",
-                                "textAlign": "center",
-                                "marginTop": "-6px",
-                                "letterSpacing": "2px",
+                                "flexGrow": "1",
+                                "display": "flex",
+                                "flexDirection": "column",
+                                "gap": "4px",
+                                "padding": "0 20px"
                             }
                         ),
-                    ]
+            
+                        # Vehicle Category
+                        html.Div(
+                            [
+                                html.Label("Vehicle Category", style={"fontWeight": "600", "fontSize": "12px"}),
+                                dbc.Checklist(
+                                    id="vehicle-filter",
+                                    options=[
+                                        {"label": "Cars", "value": "car"},
+                                        {"label": "Motorcycles", "value": "motorcycle"},
+                                        {"label": "Trucks / Vans", "value": "truck"},
+                                        {"label": "Other", "value": "other"},
+                                    ],
+                                    value=[],
+                                    inline=True,
+                                    switch=True,
+                                ),
+                            ],
+                            style={"display": "flex", "flexDirection": "column", "gap": "4px"}
+                        ),
+
+                        # Vehicle Type (exact type codes)
+                        html.Div(
+                            [
+                                html.Label("Vehicle Type", style={"fontWeight": "600", "fontSize": "12px"}),
+                                dcc.Dropdown(
+                                    id="vehicle-type-filter",
+                                    options=[{"label": t, "value": t} for t in vehicle_types],
+                                    multi=True,
+                                    placeholder="Select vehicle type(s)",
+                                    style={"minWidth": "220px"}
+                                ),
+                            ],
+                            style={"display": "flex", "flexDirection": "column", "gap": "4px"}
+                        ),
+
+                        # Export of the filtered rows
+                        html.Div(
+                            [
+                                html.Label("Export", style={"fontWeight": "600", "fontSize": "12px"}),
+                                html.Div(
+                                    [
+                                        dbc.Button("CSV", id="export-csv", color="danger", outline=True,
+                                                   size="sm", external_link=True),
+                                        dbc.Button("Parquet", id="export-parquet", color="danger", outline=True,
+                                                   size="sm", external_link=True),
+                                    ],
+                                    style={"display": "flex", "gap": "6px"}
+                                ),
+                            ],
+                            style={"display": "flex", "flexDirection": "column", "gap": "4px"}
+                        ),
+                    ],
+                    style={
+                        "display": "flex",
+                        "alignItems": "center",
+                        "justifyContent": "space-between",
+                        "width": "100%",
+                        "gap": "40px"
+                    }
                 ),
-                width=12
+                style={**card_style, "marginBottom": "25px"},
             ),
-            className="mb-4"
-        ),
 
-        # ======================
-        # FILTERS (Horizontal)
-        # ======================
-        dbc.Card(
+            # ======================
+            # DRILL-DOWN PATH (from chart clicks)
+            # ======================
             html.Div(
                 [
-                    # Borough
-                    html.Div(
-                        [
-                            html.Label("Borough", style={"fontWeight": "600", "fontSize": "12px"}),
-                            dcc.Dropdown(
-                                id="borough-filter",
-                                options=[{"label": b, "value": b} for b in borough_options],
-                                multi=True,
-                                placeholder="Select borough(s)",
-                                style={"minWidth": "180px"}
-                            ),
-                        ],
-                        style={"display": "flex", "flexDirection": "column", "gap": "4px"}
-                    ),
-        
-                    # Hour Slider
-                    html.Div(
-                        [
-                            html.Label("Hour of Day", style={"fontWeight": "600", "fontSize": "12px"}),
-                            dcc.RangeSlider(
-                                id="hour-filter",
-                                min=0,
-                                max=23,
-                                step=1,
-                                value=[0, 23],
-                                marks={
-                                    0: "12am",
-                                    6: "6am",
-                                    12: "12pm",
-                                    18: "6pm",
-                                    23: "11pm",
-                                },
-                                tooltip={"placement": "bottom", "always_visible": False},
-                                allowCross=False,
-                            ),
-                        ],
-                        style={
-                            "flexGrow": "1",
-                            "display": "flex",
-                            "flexDirection": "column",
-                            "gap": "4px",
-                            "padding": "0 20px"
-                        }
-                    ),
-        
-                    # Vehicle Category
-                    html.Div(
-                        [
-                            html.Label("Vehicle Category", style={"fontWeight": "600", "fontSize": "12px"}),
-                            dbc.Checklist(
-                                id="vehicle-filter",
-                                options=[
-                                    {"label": "Cars", "value": "car"},
-                                    {"label": "Motorcycles", "value": "motorcycle"},
-                                    {"label": "Trucks / Vans", "value": "truck"},
-                                    {"label": "Other", "value": "other"},
-                                ],
-                                value=[],
-                                inline=True,
-                                switch=True,
-                            ),
-                        ],
-                        style={"display": "flex", "flexDirection": "column", "gap": "4px"}
-                    ),
+                    html.Span("Drill-down:", style={"fontWeight": "600", "fontSize": "12px"}),
+                    html.Div(id="drilldown-path", style={"display": "flex", "gap": "6px"}),
+                    dbc.Button("Clear", id="drilldown-clear", color="secondary", outline=True, size="sm"),
                 ],
-                style={
-                    "display": "flex",
-                    "alignItems": "center",
-                    "justifyContent": "space-between",
-                    "width": "100%",
-                    "gap": "40px"
-                }
+                id="drilldown-bar",
+                style={"display": "none"},
             ),
-            style={**card_style, "marginBottom": "25px"},
-        ),
 
 
-        # ======================
-        # KPI ROW (Full Width)
-        # ======================
-        dbc.Row(
-            [
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            html.Div("TOTAL COLLISIONS", 
-                                     style={"fontWeight":"600","fontSize":"10px",
-                                            "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
-                            html.Div(id="ban-total-collisions", 
-                                     style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
-                        ],
-                        style=kpi_card,
+            # ======================
+            # KPI ROW (Full Width)
+            # ======================
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("TOTAL COLLISIONS", 
+                                         style={"fontWeight":"600","fontSize":"10px",
+                                                "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
+                                html.Div(id="ban-total-collisions", 
+                                         style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
+                            ],
+                            style=kpi_card,
+                        ),
+                        md=3
                     ),
-                    md=3
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            html.Div("TOTAL INJURIES", 
-                                     style={"fontWeight":"600","fontSize":"10px",
-                                            "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
-                            html.Div(id="ban-total-injuries", 
-                                     style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
-                        ],
-                        style=kpi_card,
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("TOTAL INJURIES", 
+                                         style={"fontWeight":"600","fontSize":"10px",
+                                                "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
+                                html.Div(id="ban-total-injuries", 
+                                         style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
+                            ],
+                            style=kpi_card,
+                        ),
+                        md=3
                     ),
-                    md=3
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            html.Div("TOTAL FATALITIES", 
-                                     style={"fontWeight":"600","fontSize":"10px",
-                                            "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
-                            html.Div(id="ban-total-fatalities", 
-                                     style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
-                        ],
-                        style=kpi_card,
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("TOTAL FATALITIES", 
+                                         style={"fontWeight":"600","fontSize":"10px",
+                                                "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
+                                html.Div(id="ban-total-fatalities", 
+                                         style={"fontSize":"28px","fontWeight":"700","textAlign":"center"}),
+                            ],
+                            style=kpi_card,
+                        ),
+                        md=3
                     ),
-                    md=3
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            html.Div("TOP 5 CONTRIBUTING FACTORS", 
-                                     style={"fontWeight":"600","fontSize":"10px",
-                                            "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
-                            html.Div(id="ban-top-factor", 
-                                     style={"fontSize":"22px","fontWeight":"700","textAlign":"center"}),
-                        ],
-                        style=kpi_card,
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("TOP 5 CONTRIBUTING FACTORS", 
+                                         style={"fontWeight":"600","fontSize":"10px",
+                                                "letterSpacing":"3px","textAlign":"center","color":"#919191"}),
+                                html.Div(id="ban-top-factor", 
+                                         style={"fontSize":"22px","fontWeight":"700","textAlign":"center"}),
+                            ],
+                            style=kpi_card,
+                        ),
+                        md=3
                     ),
-                    md=3
-                ),
-            ],
-            className="g-3 mb-4",
-        ),
+                ],
+                className="g-3 mb-4",
+            ),
 
-        # ======================
-        # ROW 1 — MAPS
-        # ======================
-        dbc.Row(
-            [
-                dbc.Col(
-                    dbc.Card(
+            # ======================
+            # ROW 1 — MAPS
+            # ======================
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Card(
+                                [
+                                    html.Div(
+                                        "Crashes by Hour of Day",
+                                        style={**title_style, "marginBottom": "5px"}
+                                    ),
+                                    dcc.Graph(
+                                        id="map-fig-hour",
+                                        config={"displayModeBar": False},
+                                        style={"height": "380px"}
+                                    ),
+                                ],
+                                style={**card_style, "padding": "20px"}
+                            ),
+                        md=6
+                    ),
+
+                    dbc.Col(
+                        dbc.Card(
                             [
                                 html.Div(
-                                    "Crashes by Hour of Day",
+                                    "Worst Crash Hotspots", 
                                     style={**title_style, "marginBottom": "5px"}
                                 ),
                                 dcc.Graph(
-                                    id="map-fig-hour",
-                                    config={"displayModeBar": False},
-                                    style={"height": "380px"}
-                                ),
+                                        id="map-fig-hotspots",
+                                        config={"displayModeBar": False},
+                                        style={"height": "385px", "overflow": "hidden"}
+                                    ),
                             ],
-                            style={**card_style, "padding": "20px"}
+                            style=card_style,
                         ),
-                    md=6
-                ),
+                        md=6
+                    ),
+                ],
+                className="g-3 mb-4",
+            ),
+
+            # ======================
+            # ROW 2 — FACTORS & USER INJURIES
+            # ======================
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("Top 5 Contributing Factors", style=title_style),
+                                dcc.Graph(id="factor-bar-fig", config={"displayModeBar": False}),
+                            ],
+                            style={**card_style,},
+                        ),
+                        md=6
+                    ),
 
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                html.Div("Injuries by Boroughs", style=title_style),
+                                dcc.Graph(id="user-type-fig", config={"displayModeBar": False}),
+                            ],
+                            style=card_style,
+                        ),
+                        md=6
+                    ),
+                ],
+                className="g-3 mb-4"
+            ),
+
+            # ======================
+            # ROW 3 — HOTSPOT RANKING
+            # ======================
+            dbc.Row(
                 dbc.Col(
                     dbc.Card(
                         [
                             html.Div(
-                                "Worst Crash Hotspots", 
-                                style={**title_style, "marginBottom": "5px"}
+                                f"Top {HOTSPOT_COUNT} Crash Hotspots",
+                                style={**title_style, "marginBottom": "10px"}
                             ),
-                            dcc.Graph(
-                                    id="map-fig-hotspots",
-                                    config={"displayModeBar": False},
-                                    style={"height": "385px", "overflow": "hidden"}
-                                ),
+                            html.Div(id="hotspot-table"),
                         ],
                         style=card_style,
                     ),
-                    md=6
+                    width=12
                 ),
-            ],
-            className="g-3 mb-4",
-        ),
+                className="g-3"
+            ),
 
-        # ======================
-        # ROW 2 — FACTORS & USER INJURIES
-        # ======================
-        dbc.Row(
-            [
+            # ======================
+            # ROW 4 — DAILY TREND
+            # ======================
+            dbc.Row(
                 dbc.Col(
                     dbc.Card(
                         [
-                            html.Div("Top 5 Contributing Factors", style=title_style),
-                            dcc.Graph(id="factor-bar-fig", config={"displayModeBar": False}),
+                            html.Div("Crashes & Injuries Over Time", style=title_style),
+                            dcc.Graph(id="trend-fig", config={"displayModeBar": False}),
                         ],
-                        style={**card_style,},
+                        style=card_style,
                     ),
-                    md=6
+                    width=12
                 ),
+                className="g-3 mt-4"
+            ),
 
+            # ======================
+            # ROW 5 — SCENARIO COMPARISON
+            # ======================
+            dbc.Row(
                 dbc.Col(
                     dbc.Card(
                         [
-                            html.Div("Injuries by Boroughs", style=title_style),
-                            dcc.Graph(id="user-type-fig", config={"displayModeBar": False}),
+                            html.Div(
+                                [
+                                    html.Div("Compare Scenarios", style=title_style),
+                                    html.Div(
+                                        [
+                                            dbc.Button("Add current filters", id="compare-add", color="danger",
+                                                       outline=True, size="sm"),
+                                            dbc.Button("Clear", id="compare-clear", color="secondary",
+                                                       outline=True, size="sm"),
+                                        ],
+                                        style={"display": "flex", "gap": "6px"}
+                                    ),
+                                ],
+                                style={
+                                    "display": "flex",
+                                    "alignItems": "center",
+                                    "justifyContent": "space-between",
+                                    "marginBottom": "10px",
+                                }
+                            ),
+                            html.Div(id="compare-table"),
+                            dcc.Graph(id="compare-hour-fig", config={"displayModeBar": False}),
                         ],
                         style=card_style,
                     ),
-                    md=6
+                    width=12
                 ),
-            ],
-            className="g-3"
-        ),
-    ]
-)
+                className="g-3 mt-4"
+            ),
+
+            # Filter sets saved for comparison
+            dcc.Store(id="compare-scenarios", data=[]),
+            # Constraints added by clicking the charts, as [field, value] pairs
+            dcc.Store(id="drilldown", data=[]),
+            # Per-tab id, so newer requests from this tab can supersede older ones
+            dcc.Store(id="session-id", storage_type="session"),
+            # Filters handed from the fast preview to the exact computation
+            dcc.Store(id="dashboard-request"),
+        ]
+    )
+
+
+def loading_layout():
+    return dbc.Container(
+        fluid=True,
+        style=gradient_bg,
+        children=[
+            header_row(),
+            dbc.Card(
+                html.Div(
+                    [
+                        dbc.Spinner(color="danger"),
+                        html.Div(
+                            "Loading crash data…",
+                            style={"fontWeight": "600", "fontSize": "14px", "color": "#555", "marginTop": "12px"},
+                        ),
+                    ],
+                    style={"textAlign": "center", "padding": "40px"},
+                ),
+                style=card_style,
+            ),
+            # Poll until the background load finishes, then reload the page
+            dcc.Interval(id="loading-poll", interval=2000),
+            dcc.Location(id="loading-reload", refresh=True),
+        ],
+    )
+
+
+def serve_layout():
+    if not store.ready:
+        return loading_layout()
+    return dashboard_layout(store.borough_options, store.vehicle_types)
+
+
+app.layout = serve_layout
+app.validation_layout = html.Div([loading_layout(), dashboard_layout([], [])])
+
 
 # ======================
-# 3. CALLBACK
+# 3. CALLBACKS
 # ======================
 @app.callback(
+    Output("loading-reload", "href"),
+    Input("loading-poll", "n_intervals"),
+)
+def reload_when_ready(_):
+    if not store.ready:
+        raise PreventUpdate
+    return app.get_relative_path("/")
+
+
+app.clientside_callback(
+    """
+    function(_, sessionId) {
+        if (sessionId) {
+            return window.dash_clientside.no_update;
+        }
+        return window.crypto.randomUUID ? window.crypto.randomUUID() : String(Math.random()).slice(2);
+    }
+    """,
+    Output("session-id", "data"),
+    Input("session-id", "modified_timestamp"),
+    State("session-id", "data"),
+)
+
+
+def export_query(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill):
+    params = [("borough", b) for b in selected_boroughs or []]
+    if selected_hours:
+        params += [("hour_min", selected_hours[0]), ("hour_max", selected_hours[1])]
+    params += [("vehicle", v) for v in selected_vehicles or []]
+    params += [("vehicle_type", t) for t in selected_vehicle_types or []]
+    params += [("drill", f"{field}:{value}") for field, value in drill_key(drill)]
+    return urlencode(params)
+
+
+@app.callback(
+    Output("export-csv", "href"),
+    Output("export-parquet", "href"),
+    Input("borough-filter", "value"),
+    Input("hour-filter", "value"),
+    Input("vehicle-filter", "value"),
+    Input("vehicle-type-filter", "value"),
+    Input("drilldown", "data"),
+)
+def update_export_links(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill):
+    query = export_query(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill)
+    return (
+        app.get_relative_path("/export/crashes.csv") + "?" + query,
+        app.get_relative_path("/export/crashes.parquet") + "?" + query,
+    )
+
+
+# Where a click lands in each chart's clickData, and what it drills into
+drill_clicks = {
+    "factor-bar-fig": ("factor", "label"),
+    "user-type-fig": ("borough", "x"),
+    "map-fig-hour": ("hour", "x"),
+}
+drill_labels = {"factor": "Factor", "borough": "Borough", "hour": "Hour"}
+
+
+@app.callback(
+    Output("drilldown", "data"),
     [
-        Output("ban-total-collisions", "children"),
-        Output("ban-total-injuries", "children"),
-        Output("ban-total-fatalities", "children"),
-        Output("ban-top-factor", "children"),
-        Output("map-fig-hotspots", "figure"),
-        Output("map-fig-hour", "figure"),
-        Output("factor-bar-fig", "figure"),
-        Output("user-type-fig", "figure"),
-    ],
-    [
-        Input("borough-filter", "value"),
-        Input("hour-filter", "value"),
-        Input("vehicle-filter", "value"),
+        Input("factor-bar-fig", "clickData"),
+        Input("user-type-fig", "clickData"),
+        Input("map-fig-hour", "clickData"),
+        Input("drilldown-clear", "n_clicks"),
     ],
+    State("drilldown", "data"),
+    prevent_initial_call=True,
 )
-def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
-    dff = df.copy()
+def update_drilldown(_factor_click, _borough_click, _hour_click, _clear, drill):
+    if ctx.triggered_id == "drilldown-clear":
+        return []
 
-    # Filters
-    if selected_boroughs:
-        dff = dff[dff["BOROUGH"].isin(selected_boroughs)]
+    click = ctx.triggered[0]["value"]
+    if not click or not click.get("points"):
+        raise PreventUpdate
+    field, attr = drill_clicks[ctx.triggered_id]
+    value = click["points"][0].get(attr)
 
-    if selected_hours:
-        hmin, hmax = selected_hours
-        dff = dff[dff["CRASH_HOUR"].between(hmin, hmax, inclusive="both")]
+    # Each field narrows once: a second borough or hour would select nothing
+    drill = drill or []
+    if value is None or value == "Unknown" or any(f == field for f, _ in drill):
+        raise PreventUpdate
+    return drill + [[field, value]]
 
-    # Vehicle filter (multi-select checklist)
-    if selected_vehicles:
-    
-        category_cols = [col + "_CATEGORY" for col in vehicle_cols]
-    
-        # Row matches if ANY selected category appears in ANY vehicle column
-        mask = dff[category_cols].apply(
-            lambda row: any(cat in row.values for cat in selected_vehicles),
-            axis=1
+
+@app.callback(
+    Output("drilldown-path", "children"),
+    Output("drilldown-bar", "style"),
+    Input("drilldown", "data"),
+)
+def render_drilldown(drill):
+    if not drill:
+        return [], {"display": "none"}
+    badges = [
+        dbc.Badge(
+            f"{drill_labels[field]}: {hour_to_label(value) if field == 'hour' else value}",
+            color="danger",
+            className="p-2",
         )
-    
-        dff = dff[mask]
+        for field, value in drill_key(drill)
+    ]
+    return badges, {"display": "flex", "alignItems": "center", "gap": "10px", "marginBottom": "20px"}
+
+
+hotspot_table_cols = [*hotspot_cols, "BOROUGH", "LATITUDE", "LONGITUDE", "LOCATION"]
+
+
+def hotspot_table(hotspots):
+    header = html.Thead(html.Tr([
+        html.Th("#"), html.Th("Location"), html.Th("Borough"),
+        html.Th("Crashes"), html.Th("Injured"), html.Th("Killed"),
+    ]))
+    rows = [
+        html.Tr([
+            html.Td(rank),
+            html.Td(row.LOCATION),
+            html.Td(row.BOROUGH if isinstance(row.BOROUGH, str) else "Unknown"),
+            html.Td(f"{row.CRASHES:,}"),
+            html.Td(f"{int(row.INJURED):,}"),
+            html.Td(f"{int(row.KILLED):,}"),
+        ])
+        for rank, row in enumerate(hotspots.itertuples(index=False), start=1)
+    ]
+    return dbc.Table([header, html.Tbody(rows)], size="sm", hover=True, striped=True, className="mb-0")
 
 
-    if dff.empty:
-        empty = go.Figure()
-        empty.update_layout(
-            paper_bgcolor="rgba(0,0,0,0)",
-            xaxis={"visible": False}, yaxis={"visible": False},
-            annotations=[dict(text="No data for selected filters", x=0.5, y=0.5, showarrow=False)]
-        )
-        return ("0","0","0","N/A",empty,empty,empty,empty)
+def hour_to_label(h):
+    if h == 0:
+        return "12am"
+    elif h < 12:
+        return f"{h}am"
+    elif h == 12:
+        return "12pm"
+    else:
+        return f"{h-12}pm"
 
-    # KPIs
-    total_collisions = f"{len(dff):,}"
-    total_injuries = f"{dff['TOTAL_INJURED'].sum():,}"
-    total_fatalities = f"{dff['TOTAL_KILLED'].sum():,}"
-    top_factor = dff["TOP_FACTOR_SHORT"].value_counts().idxmax()
 
-    # ======================
-    # Hotspots Heatmap
-    # ======================
-    dff_map = dff.sample(min(5000, len(dff)), random_state=42)
-    
-    fig_hotspots = px.density_mapbox(
-        dff_map,
-        lat="LATITUDE",
-        lon="LONGITUDE",
-        z="TOTAL_INJURED",
-        radius=20,
-        center={"lat": 40.7050, "lon": -73.9700},
-        zoom=10,
-        height=450,
-        color_continuous_scale=[(0, "#fee2e2"), (1, "#b91c1c")],
-        range_color=(0, 10),
-    )
-    
-    # Invisible scatter layer for custom tooltips
-    fig_hotspots.add_scattermapbox(
-        lat=dff_map["LATITUDE"],
-        lon=dff_map["LONGITUDE"],
-        mode="markers",
-        marker=dict(size=8, color="rgba(0,0,0,0)"),
-        hovertemplate=(
-            "<b>Street:</b> %{customdata[0]}<br>"
-            "<b>Borough:</b> %{customdata[1]}<br>"
-            "<b>Total Injured:</b> %{customdata[2]}<extra></extra>"
-        ),
-        customdata=np.stack([
-            dff_map["ON STREET NAME"].fillna("Unknown"),
-            dff_map["BOROUGH"].fillna("Unknown"),
-            dff_map["TOTAL_INJURED"].fillna(0),
-        ], axis=-1)
-    )
-    
-    fig_hotspots.update_layout(
-        mapbox_style="open-street-map",
-        autosize=False,
-        height=450,
-        uirevision="constant",
-        margin=dict(l=0, r=0, t=0, b=0),
-        mapbox=dict(
-            center={"lat": 40.7050, "lon": -73.9700},
-            zoom=10,
-        ),
-    
-        # Hide injured scale bar
-        coloraxis_showscale=False,
-    
-        paper_bgcolor="rgba(0,0,0,0)",
-        hoverlabel=dict(
-            bgcolor="#f8f9fa",
-            bordercolor="#333333",
-            font=dict(color="#333333", size=14),
-            align="left",
-            namelength=-1,
-        ),
+def hourly_figure(hour_counts, ci=None):
+    import plotly.express as px
+
+    hour_group = pd.DataFrame({"CRASH_HOUR": range(24), "COUNT": hour_counts})
+    hour_group["LABEL"] = hour_group["CRASH_HOUR"].apply(hour_to_label)
+
+    # Build Y-axis ticks: 1K, 2K, 3K…
+    max_y = hour_group["COUNT"].max()
+    yticks = list(range(0, int(max_y) + 1000, 1000))
+    yticklabels = [f"{int(v/1000)}K" if v != 0 else "0" for v in yticks]
+
+    # Curve line
+    fig_hour = px.line(
+        hour_group,
+        x="CRASH_HOUR",
+        y="COUNT",
+        markers=False,
+        line_shape="spline",
     )
 
-    # ======================
-    # Hourly Line Graph
-    # ======================
-    def hour_to_label(h):
-        if h == 0:
-            return "12am"
-        elif h < 12:
-            return f"{h}am"
-        elif h == 12:
-            return "12pm"
-        else:
-            return f"{h-12}pm"
-    
-    hour_group = (
-        dff.groupby("CRASH_HOUR")
-           .size()
-           .reindex(range(24), fill_value=0)
-           .reset_index()
-    )
-    hour_group.columns = ["CRASH_HOUR", "COUNT"]
-    hour_group["LABEL"] = hour_group["CRASH_HOUR"].apply(hour_to_label)
-    
-    # Build Y-axis ticks: 1K, 2K, 3K…
-    max_y = hour_group["COUNT"].max()
-    yticks = list(range(0, int(max_y) + 1000, 1000))
-    yticklabels = [f"{int(v/1000)}K" if v != 0 else "0" for v in yticks]
-    
-    # Curve line
-    fig_hour = px.line(
-        hour_group,
-        x="CRASH_HOUR",
-        y="COUNT",
-        markers=False,
-        line_shape="spline",
-    )
-    
     # Hover text
     fig_hour.update_traces(
         hovertemplate="<b>Crash Hour:</b> %{customdata}<br>"
@@ -722,7 +787,22 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
         customdata=hour_group["LABEL"],
         line=dict(width=3, color="#b91c1c"),
     )
-    
+
+    # Confidence band around sampled estimates
+    if ci is not None:
+        hours = list(range(24))
+        fig_hour.add_scatter(
+            x=hours, y=np.asarray(hour_counts) + ci,
+            mode="lines", line=dict(width=0, shape="spline"),
+            hoverinfo="skip", showlegend=False,
+        )
+        fig_hour.add_scatter(
+            x=hours, y=np.maximum(np.asarray(hour_counts) - ci, 0),
+            mode="lines", line=dict(width=0, shape="spline"),
+            fill="tonexty", fillcolor="rgba(185, 28, 28, 0.15)",
+            hoverinfo="skip", showlegend=False,
+        )
+
     # Styling
     fig_hour.update_layout(
         xaxis=dict(
@@ -736,7 +816,7 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
             linewidth=1,
             range=[-0.5, 23.5],
         ),
-    
+
         yaxis=dict(
             title="Number of Crashes",
             showline=True,
@@ -746,11 +826,11 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
             tickvals=yticks,
             ticktext=yticklabels,
         ),
-    
+
         plot_bgcolor="#f8f9fa",
         paper_bgcolor="rgba(0,0,0,0)",
         font=dict(color="#333", size=12),
-    
+
         margin=dict(l=70, r=30, t=30, b=30),
 
         hoverlabel=dict(
@@ -762,25 +842,26 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
         ),
     )
 
-    # ======================
-    # Factor Treemap (fixed + sorted)
-    # ======================
+    return fig_hour
+
+
+def factor_figure(top_factors):
+    import plotly.express as px
+
     factor_counts = (
-        dff["TOP_FACTOR_SHORT"]
-        .value_counts()
-        .head()
+        top_factors
+        .rename_axis("TOP_FACTOR_SHORT")
         .reset_index(name="Count")
-        .rename(columns={"index": "TOP_FACTOR_SHORT"})
     )
-    
+
     # Ensure descending order so rank 1 = darkest
     factor_counts = factor_counts.sort_values("Count", ascending=False).reset_index(drop=True)
-    
+
     # Normalize
     max_c = factor_counts["Count"].max()
     min_c = factor_counts["Count"].min()
     factor_counts["NORM"] = (factor_counts["Count"] - min_c) / (max_c - min_c + 1e-9)
-    
+
     # Gradient function
     def gradient_color(v):
         import colorsys
@@ -789,16 +870,16 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
         l = 0.85 - 0.45 * v    # v=1 => dark, v=0 => light
         r, g, b = colorsys.hls_to_rgb(h, l, s)
         return f"rgb({int(r*255)},{int(g*255)},{int(b*255)})"
-    
+
     factor_counts["COLOR"] = factor_counts["NORM"].apply(gradient_color)
-    
+
     fig_factor = px.treemap(
         factor_counts,
         path=["TOP_FACTOR_SHORT"],
         values="Count",
         color="COLOR",
     )
-    
+
     fig_factor.update_traces(
         marker=dict(
             colors=factor_counts["COLOR"],
@@ -810,7 +891,7 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
             "<b>Number of Injuries:</b> %{value:,}<extra></extra>"
         ),
     )
-    
+
     fig_factor.update_layout(
         margin=dict(l=0, r=0, t=0, b=0),
         paper_bgcolor="#f8f9fa",
@@ -825,17 +906,137 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
         ),
     )
 
+    return fig_factor
+
+
+def build_dashboard(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill=(),
+                    session_id=None):
+    # plotly.express pulls in a large import tree; load it on first use
+    import plotly.express as px
+
+    backend = store.backend
+    key = filter_key(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types)
+    # A drill-down narrows this session's previous selection rather than starting over
+    sel = session_selections.get(backend, session_id, key, drill)
+    summary = None if drill else store.precomputed.get(key)
+    if summary is None:
+        summary = summarize_selection(backend, sel)
+
+    if summary["collisions"] == 0:
+        empty = go.Figure()
+        empty.update_layout(
+            paper_bgcolor="rgba(0,0,0,0)",
+            xaxis={"visible": False}, yaxis={"visible": False},
+            annotations=[dict(text="No data for selected filters", x=0.5, y=0.5, showarrow=False)]
+        )
+        return ("0","0","0","N/A",empty,empty,empty,empty,"No data for selected filters")
+
+    # KPIs
+    total_collisions = f"{summary['collisions']:,}"
+    total_injuries = f"{summary['injured']:,}"
+    total_fatalities = f"{summary['killed']:,}"
+    top_factor = summary["top_factor"] or "N/A"
+
+    # ======================
+    # Hotspots Heatmap
+    # ======================
+    # A random draw of rows rather than an aggregate, so never precomputed
+    dff_map = backend.map_sample(sel, 5000, seed=42)
+    
+    fig_hotspots = px.density_mapbox(
+        dff_map,
+        lat="LATITUDE",
+        lon="LONGITUDE",
+        z="TOTAL_INJURED",
+        radius=20,
+        center={"lat": 40.7050, "lon": -73.9700},
+        zoom=10,
+        height=450,
+        color_continuous_scale=[(0, "#fee2e2"), (1, "#b91c1c")],
+        range_color=(0, 10),
+    )
+    
+    # Invisible scatter layer for custom tooltips
+    fig_hotspots.add_scattermapbox(
+        lat=dff_map["LATITUDE"],
+        lon=dff_map["LONGITUDE"],
+        mode="markers",
+        marker=dict(size=8, color="rgba(0,0,0,0)"),
+        hovertemplate=(
+            "<b>Street:</b> %{customdata[0]}<br>"
+            "<b>Borough:</b> %{customdata[1]}<br>"
+            "<b>Total Injured:</b> %{customdata[2]}<extra></extra>"
+        ),
+        customdata=np.stack([
+            dff_map["ON STREET NAME"].fillna("Unknown"),
+            dff_map["BOROUGH"].fillna("Unknown"),
+            dff_map["TOTAL_INJURED"].fillna(0),
+        ], axis=-1)
+    )
+
+    # Ranked hotspots over the full selection (not the sample), numbered
+    hotspots = pd.DataFrame(summary["hotspots"], columns=hotspot_table_cols)
+    fig_hotspots.add_scattermapbox(
+        lat=hotspots["LATITUDE"],
+        lon=hotspots["LONGITUDE"],
+        mode="markers+text",
+        marker=dict(size=14, color="#b91c1c"),
+        text=[str(i + 1) for i in range(len(hotspots))],
+        textfont=dict(color="white", size=9),
+        hovertemplate=(
+            "<b>#%{text} %{customdata[0]}</b><br>"
+            "<b>Crashes:</b> %{customdata[1]}<br>"
+            "<b>Injured:</b> %{customdata[2]}<extra></extra>"
+        ),
+        customdata=np.stack([
+            hotspots["LOCATION"].fillna("Unknown"),
+            hotspots["CRASHES"].map("{:,}".format),
+            hotspots["INJURED"].astype(int).map("{:,}".format),
+        ], axis=-1) if len(hotspots) else None,
+    )
+    
+    fig_hotspots.update_layout(
+        mapbox_style="open-street-map",
+        autosize=False,
+        height=450,
+        uirevision="constant",
+        margin=dict(l=0, r=0, t=0, b=0),
+        mapbox=dict(
+            center={"lat": 40.7050, "lon": -73.9700},
+            zoom=10,
+        ),
+    
+        # Hide injured scale bar
+        coloraxis_showscale=False,
+    
+        paper_bgcolor="rgba(0,0,0,0)",
+        hoverlabel=dict(
+            bgcolor="#f8f9fa",
+            bordercolor="#333333",
+            font=dict(color="#333333", size=14),
+            align="left",
+            namelength=-1,
+        ),
+    )
+
+    # ======================
+    # Hourly Line Graph
+    # ======================
+    fig_hour = hourly_figure(np.array(summary["hourly"]))
+
+    # ======================
+    # Factor Treemap (fixed + sorted)
+    # ======================
+    fig_factor = factor_figure(pd.Series(
+        [f["count"] for f in summary["top_factors"]],
+        index=[f["factor"] for f in summary["top_factors"]],
+        name="Count",
+    ))
+
     # ======================
     # Injuries by Borough
     # ======================
-    user_group = dff.groupby("BOROUGH", dropna=False)[
-        [
-            "NUMBER OF PEDESTRIANS INJURED",
-            "NUMBER OF CYCLIST INJURED",
-            "NUMBER OF MOTORIST INJURED",
-            "TOTAL_INJURED",
-        ]
-    ].sum().reset_index()
+    user_group = pd.DataFrame(summary["borough_injuries"], columns=["BOROUGH", *injury_cols])
     
     user_group["BOROUGH"] = user_group["BOROUGH"].fillna("Unknown")
     
@@ -955,9 +1156,492 @@ def update_dashboard(selected_boroughs, selected_hours, selected_vehicles):
         fig_hour,
         fig_factor,
         fig_combined,
+        hotspot_table(hotspots),
     )
 
-server = app.server 
+
+# Identical concurrent requests (e.g. everyone opening a shared link)
+# share one computation, and at most COMPUTE_SLOTS run at once. A request
+# still queued for a slot when its session has sent a newer one (the user
+# kept dragging the hour slider) is dropped without computing.
+COMPUTE_SLOTS = int(os.environ.get("COMPUTE_SLOTS", os.cpu_count() or 1))
+compute_slots = threading.BoundedSemaphore(COMPUTE_SLOTS)
+dashboard_flights = SingleFlight()
+latest_requests = LatestRequests()
+session_selections = SessionSelections()
+
+
+# One color per comparison scenario, in the order they were added
+SCENARIO_COLORS = ["#b91c1c", "#2563eb", "#059669", "#d97706", "#7c3aed", "#0891b2"]
+vehicle_labels = {"car": "Cars", "motorcycle": "Motorcycles", "truck": "Trucks / Vans", "other": "Other"}
+
+
+def scenario_label(scenario):
+    boroughs = ", ".join(b.title() for b in sorted(scenario["boroughs"] or ())) or "All boroughs"
+    hours = scenario["hours"]
+    if hours and list(hours) != [0, 23]:
+        boroughs += f" · {hour_to_label(hours[0])}–{hour_to_label(hours[1])}"
+    if scenario["vehicles"]:
+        boroughs += " · " + ", ".join(vehicle_labels.get(v, v) for v in scenario["vehicles"])
+    if scenario["vehicle_types"]:
+        boroughs += " · " + ", ".join(scenario["vehicle_types"])
+    return boroughs
+
+
+@app.callback(
+    Output("compare-scenarios", "data"),
+    [
+        Input("compare-add", "n_clicks"),
+        Input("compare-clear", "n_clicks"),
+    ],
+    [
+        State("borough-filter", "value"),
+        State("hour-filter", "value"),
+        State("vehicle-filter", "value"),
+        State("vehicle-type-filter", "value"),
+        State("compare-scenarios", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_scenarios(_add, _clear, selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types,
+                     scenarios):
+    if ctx.triggered_id == "compare-clear":
+        return []
+
+    scenario = {
+        "boroughs": selected_boroughs,
+        "hours": selected_hours,
+        "vehicles": selected_vehicles,
+        "vehicle_types": selected_vehicle_types,
+    }
+    key = filter_key(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types)
+    scenarios = scenarios or []
+    if len(scenarios) >= MAX_SCENARIOS or any(
+        filter_key(s["boroughs"], s["hours"], s["vehicles"], s["vehicle_types"]) == key for s in scenarios
+    ):
+        raise PreventUpdate
+    return scenarios + [scenario]
+
+
+def comparison_table(scenarios, results):
+    header = html.Thead(html.Tr([
+        html.Th("Scenario"), html.Th("Crashes"), html.Th("Injured"), html.Th("Killed"),
+    ]))
+    rows = [
+        html.Tr([
+            html.Td([
+                html.Span("●", style={"color": color, "marginRight": "6px"}),
+                scenario_label(scenario),
+            ]),
+            html.Td(f"{result['collisions']:,}"),
+            html.Td(f"{int(result['injured']):,}"),
+            html.Td(f"{int(result['killed']):,}"),
+        ])
+        for scenario, result, color in zip(scenarios, results, SCENARIO_COLORS)
+    ]
+    return dbc.Table([header, html.Tbody(rows)], size="sm", hover=True, striped=True, className="mb-0")
+
+
+def comparison_figure(scenarios, results):
+    fig = go.Figure()
+    for scenario, result, color in zip(scenarios, results, SCENARIO_COLORS):
+        fig.add_scatter(
+            x=list(range(24)),
+            y=result["hourly"],
+            name=scenario_label(scenario),
+            mode="lines",
+            line=dict(width=3, color=color, shape="spline"),
+            customdata=[hour_to_label(h) for h in range(24)],
+            hovertemplate="<b>Crash Hour:</b> %{customdata}<br>"
+                          "<b>Number of Crashes:</b> %{y:,}<extra></extra>",
+        )
+
+    fig.update_layout(
+        xaxis=dict(
+            title="Hour of Day",
+            tickmode="array",
+            tickvals=[0, 4, 8, 12, 16, 20, 23],
+            ticktext=["12am", "4am", "8am", "12pm", "4pm", "8pm", "12am"],
+            showline=True,
+            linecolor="#333",
+            gridcolor="rgba(0,0,0,0.07)",
+            range=[-0.5, 23.5],
+        ),
+        yaxis=dict(
+            title="Number of Crashes",
+            showline=True,
+            linecolor="#333",
+            gridcolor="rgba(0,0,0,0.07)",
+            zeroline=False,
+        ),
+        plot_bgcolor="#f8f9fa",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="#333", size=12),
+        margin=dict(l=70, r=30, t=30, b=30),
+        legend=dict(orientation="h", x=0.5, xanchor="center", y=1.15),
+        hoverlabel=dict(
+            bgcolor="#f8f9fa",
+            bordercolor="#333",
+            font=dict(color="#333"),
+        ),
+    )
+    return fig
+
+
+@app.callback(
+    [
+        Output("compare-table", "children"),
+        Output("compare-hour-fig", "figure"),
+        Output("compare-add", "disabled"),
+    ],
+    Input("compare-scenarios", "data"),
+)
+def update_comparison(scenarios):
+    if not store.ready:
+        raise PreventUpdate
+
+    scenarios = scenarios or []
+    if not scenarios:
+        empty = go.Figure()
+        empty.update_layout(
+            paper_bgcolor="rgba(0,0,0,0)",
+            xaxis={"visible": False}, yaxis={"visible": False},
+            annotations=[dict(text="Add filter sets to compare them side by side", x=0.5, y=0.5, showarrow=False)]
+        )
+        return None, empty, False
+
+    # Every scenario is evaluated in the same pass over the data
+    with compute_slots:
+        results = store.backend.compare(
+            [filter_key(s["boroughs"], s["hours"], s["vehicles"], s["vehicle_types"]) for s in scenarios]
+        )
+    return (
+        comparison_table(scenarios, results),
+        comparison_figure(scenarios, results),
+        len(scenarios) >= MAX_SCENARIOS,
+    )
+
+
+# Most points per series the trend chart receives; zooming re-queries the
+# visible window at this same budget, so detail increases as you zoom in
+TREND_POINTS = int(os.environ.get("TREND_POINTS", 500))
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def trend_window(relayout):
+    """Day range the trend chart's x-axis was zoomed to, or None for all days."""
+    if "xaxis.range[0]" in relayout:
+        lo, hi = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        lo, hi = relayout["xaxis.range"]
+    else:
+        return None
+    return (pd.Timestamp(lo) - EPOCH).days, (pd.Timestamp(hi) - EPOCH).days + 1
+
+
+def trend_figure(days, crashes, injuries):
+    fig = go.Figure()
+    dates = np.datetime64("1970-01-01") + days.astype("timedelta64[D]")
+
+    # Downsample each series on its own so both keep their peaks
+    for name, values, color in (
+        ("Crashes", crashes, "#b91c1c"),
+        ("Injuries", injuries, "#f87171"),
+    ):
+        keep = lttb(days, values, TREND_POINTS)
+        fig.add_scatter(
+            x=dates[keep],
+            y=values[keep],
+            name=name,
+            mode="lines",
+            line=dict(width=2, color=color),
+            hovertemplate=f"<b>%{{x|%b %d, %Y}}</b><br><b>{name}:</b> %{{y:,}}<extra></extra>",
+        )
+
+    fig.update_layout(
+        # Keep the user's zoom when the data under it is re-queried
+        uirevision="trend",
+        xaxis=dict(showline=True, linecolor="#333", gridcolor="rgba(0,0,0,0.07)"),
+        yaxis=dict(
+            title="Per Day",
+            showline=True,
+            linecolor="#333",
+            gridcolor="rgba(0,0,0,0.07)",
+            zeroline=False,
+        ),
+        plot_bgcolor="#f8f9fa",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color="#333", size=12),
+        margin=dict(l=70, r=30, t=30, b=30),
+        legend=dict(orientation="h", x=0.5, xanchor="center", y=1.1),
+        hoverlabel=dict(
+            bgcolor="#f8f9fa",
+            bordercolor="#333",
+            font=dict(color="#333"),
+        ),
+    )
+    return fig
+
+
+@app.callback(
+    Output("trend-fig", "figure"),
+    [
+        Input("borough-filter", "value"),
+        Input("hour-filter", "value"),
+        Input("vehicle-filter", "value"),
+        Input("vehicle-type-filter", "value"),
+        Input("drilldown", "data"),
+        Input("trend-fig", "relayoutData"),
+    ],
+    State("session-id", "data"),
+)
+def update_trend(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill, relayout,
+                 session_id):
+    if not store.ready:
+        raise PreventUpdate
+
+    relayout = relayout or {}
+    window = trend_window(relayout)
+    if ctx.triggered_id == "trend-fig" and window is None and "xaxis.autorange" not in relayout:
+        # Hover, resize or y-only changes: nothing to re-query
+        raise PreventUpdate
+
+    backend = store.backend
+    key = filter_key(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types)
+    sel = session_selections.get(backend, session_id, key, drill_key(drill))
+    days, crashes, injuries = backend.daily_counts(sel, *(window or (None, None)))
+    return trend_figure(days, crashes, injuries)
+
+
+# Selections estimated at or above this many crashes get a sampled preview
+# (with 95% confidence bounds) before the exact results; 0 turns it off
+PROGRESSIVE_MIN_ROWS = int(os.environ.get("PROGRESSIVE_MIN_ROWS", 250_000))
+
+estimate_note_style = {"fontSize": "10px", "fontWeight": "500", "color": "#919191"}
+
+
+def estimated_kpi(value, ci):
+    return [
+        html.Span(f"≈{value:,.0f}"),
+        html.Div(f"± {ci:,.0f} (95% CI)", style=estimate_note_style),
+    ]
+
+
+@app.callback(
+    [
+        Output("ban-total-collisions", "children", allow_duplicate=True),
+        Output("ban-total-injuries", "children", allow_duplicate=True),
+        Output("ban-total-fatalities", "children", allow_duplicate=True),
+        Output("ban-top-factor", "children", allow_duplicate=True),
+        Output("map-fig-hour", "figure", allow_duplicate=True),
+        Output("factor-bar-fig", "figure", allow_duplicate=True),
+        Output("dashboard-request", "data"),
+    ],
+    [
+        Input("borough-filter", "value"),
+        Input("hour-filter", "value"),
+        Input("vehicle-filter", "value"),
+        Input("vehicle-type-filter", "value"),
+        Input("drilldown", "data"),
+    ],
+    prevent_initial_call="initial_duplicate",
+)
+def preview_dashboard(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill):
+    if not store.ready:
+        raise PreventUpdate
+
+    # The exact callback is chained off this store, so it always lands last
+    request_data = {
+        "boroughs": selected_boroughs,
+        "hours": selected_hours,
+        "vehicles": selected_vehicles,
+        "vehicle_types": selected_vehicle_types,
+        "drill": drill,
+    }
+
+    estimate = store.sample.estimate(
+        selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types, drill_key(drill)
+    )
+    collisions, collisions_ci = estimate["collisions"]
+    if PROGRESSIVE_MIN_ROWS <= 0 or collisions < PROGRESSIVE_MIN_ROWS or not estimate["factors"]:
+        return (no_update,) * 6 + (request_data,)
+
+    top_factor, (top_count, top_ci) = next(iter(estimate["factors"].items()))
+    top_factor_kpi = [
+        html.Span(f"≈ {top_factor}"),
+        html.Div(f"{top_count / collisions:.1%} ± {top_ci / collisions:.1%} of crashes", style=estimate_note_style),
+    ]
+
+    hourly = np.array([value for value, _ in estimate["hourly"]])
+    hourly_ci = np.array([ci for _, ci in estimate["hourly"]])
+    factors = pd.Series({name: round(value) for name, (value, _) in estimate["factors"].items()})
+
+    return (
+        estimated_kpi(collisions, collisions_ci),
+        estimated_kpi(*estimate["injured"]),
+        estimated_kpi(*estimate["killed"]),
+        top_factor_kpi,
+        hourly_figure(np.round(hourly), ci=hourly_ci),
+        factor_figure(factors),
+        request_data,
+    )
+
+
+@app.callback(
+    [
+        Output("ban-total-collisions", "children"),
+        Output("ban-total-injuries", "children"),
+        Output("ban-total-fatalities", "children"),
+        Output("ban-top-factor", "children"),
+        Output("map-fig-hotspots", "figure"),
+        Output("map-fig-hour", "figure"),
+        Output("factor-bar-fig", "figure"),
+        Output("user-type-fig", "figure"),
+        Output("hotspot-table", "children"),
+    ],
+    Input("dashboard-request", "data"),
+    State("session-id", "data"),
+)
+def update_dashboard(request_data, session_id):
+    if not store.ready or request_data is None:
+        raise PreventUpdate
+
+    key = filter_key(
+        request_data["boroughs"], request_data["hours"], request_data["vehicles"], request_data["vehicle_types"]
+    )
+    drill = drill_key(request_data["drill"])
+    token = latest_requests.begin(session_id)
+
+    def compute():
+        with compute_slots:
+            latest_requests.check(session_id, token)
+            return build_dashboard(*key, drill=drill, session_id=session_id)
+
+    try:
+        return dashboard_flights.do((key, drill), compute)
+    except Superseded:
+        raise PreventUpdate
+
+server = app.server
+
+
+# ======================
+# 4. HEALTH PROBES
+# ======================
+@server.route("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@server.route("/readyz")
+def readyz():
+    if store.error is not None:
+        return {"status": "error", "error": str(store.error)}, 503
+    if not store.ready:
+        return {"status": "loading"}, 503
+    ingest = store.ingest_rows_per_second
+    return {
+        "status": "ready",
+        "rows": len(store.df),
+        "load_seconds": round(store.load_seconds, 2),
+        "ingest_rows_per_second": round(ingest) if ingest is not None else None,
+    }
+
+
+# ======================
+# 5. EXPORT
+# ======================
+@server.route("/export/crashes.<fmt>")
+def export_crashes(fmt):
+    if fmt not in export_formats:
+        abort(404)
+    if not store.ready:
+        return {"status": "loading"}, 503
+
+    # Same filters as update_dashboard, taken from the query string
+    hours = None
+    if "hour_min" in request.args or "hour_max" in request.args:
+        hours = [request.args.get("hour_min", 0, type=int), request.args.get("hour_max", 23, type=int)]
+    backend = store.backend
+    sel = backend.select(
+        request.args.getlist("borough"), hours, request.args.getlist("vehicle"), request.args.getlist("vehicle_type")
+    )
+    drill = drill_key(d.split(":", 1) for d in request.args.getlist("drill") if ":" in d)
+    sel = refine_all(backend, sel, drill)
+
+    columns = export_columns(store.df)
+    chunks = backend.iter_rows(sel, columns, EXPORT_CHUNK_ROWS)
+    if fmt == "csv":
+        body = iter_csv(chunks, columns)
+    else:
+        body = iter_parquet(chunks, store.df.dtypes[columns])
+
+    return Response(
+        stream_with_context(body),
+        mimetype=export_formats[fmt],
+        headers={"Content-Disposition": f"attachment; filename=nyc_crashes.{fmt}"},
+    )
+
+# ======================
+# 6. COMPRESSION & HTTP CACHING
+# ======================
+# Brotli or gzip, whichever the client prefers, for callback JSON, the
+# index page, layout and scripts. Streamed responses (CSV export) are
+# compressed chunk by chunk. Configured by hand rather than through
+# Dash(compress=True), which pins flask-compress to gzip only.
+server.config.update(
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_ALGORITHM_STREAMING=["br", "deflate"],
+    COMPRESS_MIMETYPES=[
+        "text/html",
+        "text/css",
+        "text/csv",
+        "text/javascript",
+        "application/javascript",
+        "application/json",
+    ],
+)
+Compress(server)
+
+LAYOUT_ROUTES = {
+    app.config.routes_pathname_prefix,
+    app.config.routes_pathname_prefix + "_dash-layout",
+    app.config.routes_pathname_prefix + "_dash-dependencies",
+}
+STATIC_PREFIXES = (
+    app.config.routes_pathname_prefix + "_dash-component-suites/",
+    app.config.routes_pathname_prefix + app.config.assets_url_path.lstrip("/"),
+)
+
+
+# Registered after Compress, so it runs first: validators are checked on
+# the uncompressed body, and a 304 skips compression entirely.
+@server.after_request
+def add_cache_headers(response):
+    if request.method != "GET" or response.status_code != 200:
+        return response
+
+    if request.path in LAYOUT_ROUTES:
+        if not store.ready:
+            # The loading page must never be reused once the data is in
+            response.cache_control.no_store = True
+            return response
+        # Weak: the same layout is served under several content encodings
+        digest = zlib.crc32(response.get_data())
+        response.set_etag(f"{store.version}-{digest:08x}", weak=True)
+        response.cache_control.no_cache = True
+        response.cache_control.public = True
+        return response.make_conditional(request)
+
+    if request.path.startswith(STATIC_PREFIXES):
+        response.cache_control.public = True
+        if response.cache_control.max_age:
+            # Fingerprinted bundle: the URL changes whenever the content does
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+    return response
+
 
 if __name__ == "__main__":
     app.run_server(
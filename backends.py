@@ -0,0 +1,484 @@
+"""Query backends for the dashboard aggregations.
+
+A backend turns the dashboard filters into a selection and answers the
+aggregate questions the callbacks ask about that selection. Two
+implementations share the same interface:
+
+* ``PandasBackend`` (default) works on the in-memory DataFrame using
+  pre-encoded integer columns and ``np.bincount``.
+* ``DuckDBBackend`` runs vectorized, multithreaded SQL directly over the
+  prepared Parquet file.
+
+Pick one with the ``QUERY_BACKEND`` environment variable.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from data import PARQUET_PATH, vehicle_categories, vehicle_category_cols, vehicle_cols
+
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas")
+
+injury_cols = [
+    "NUMBER OF PEDESTRIANS INJURED",
+    "NUMBER OF CYCLIST INJURED",
+    "NUMBER OF MOTORIST INJURED",
+    "TOTAL_INJURED",
+]
+
+map_cols = ["LATITUDE", "LONGITUDE", "TOTAL_INJURED", "ON STREET NAME", "BOROUGH"]
+
+hotspot_cols = ["LOCATION_ID", "CRASHES", "INJURED", "KILLED"]
+
+# Columns a chart click can narrow a selection by
+drill_cols = {"factor": "TOP_FACTOR_SHORT", "borough": "BOROUGH", "hour": "CRASH_HOUR"}
+
+
+# Scenarios per comparison; each one is a bit of the (uint8) membership code,
+# so the single aggregation has 2 ** MAX_SCENARIOS x 25 groups
+MAX_SCENARIOS = 6
+
+
+def _scenario_totals(code, hour, crashes, injured, killed, n):
+    """Per-scenario KPIs and hourly counts from totals grouped by membership code and hour.
+
+    ``code`` is a bitmask with bit ``i`` set for rows matching scenario ``i``;
+    ``hour`` is 0..23, or 24 for unparseable times. ``crashes`` is how many
+    crashes each entry stands for (``None`` when entries are single rows).
+    """
+    groups = 2 ** n
+    key = code * 25 + hour
+    by_code = [np.bincount(key, weights=w, minlength=groups * 25).reshape(groups, 25) for w in (crashes, injured, killed)]
+
+    # member[i, c] is 1 when code c includes scenario i, so one product
+    # adds up every group each scenario is part of
+    member = (np.arange(groups) >> np.arange(n)[:, None]) & 1
+    crashes, injured, killed = (member @ totals for totals in by_code)
+    return [
+        {
+            "collisions": int(crashes[i].sum()),
+            "injured": injured[i].sum(),
+            "killed": killed[i].sum(),
+            "hourly": crashes[i, :24].astype(np.int64),
+        }
+        for i in range(n)
+    ]
+
+
+def _with_locations(ranked, locations):
+    """Attach label, borough and position from the location index to ranked IDs."""
+    return ranked.join(locations, on="LOCATION_ID")
+
+
+def _posting_lists(columns):
+    """Map each value found in ``columns`` to the sorted int32 positions of the rows containing it."""
+    # Row-major flattening keeps each row's values together and rows in order
+    codes, values = pd.factorize(columns.to_numpy().ravel())
+    rows = np.repeat(np.arange(len(columns), dtype=np.int32), columns.shape[1])
+    present = codes >= 0
+    codes, rows = codes[present], rows[present]
+
+    # Stable sort by value, so positions stay ascending within each list
+    order = np.argsort(codes, kind="stable")
+    codes, rows = codes[order], rows[order]
+
+    # A row listing the same value in two columns would appear twice
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+    codes, rows = codes[first], rows[first]
+
+    bounds = np.searchsorted(codes, np.arange(len(values) + 1))
+    return {value: rows[bounds[i]:bounds[i + 1]] for i, value in enumerate(values)}
+
+
+def _codes(values, categories):
+    """Integer codes for ``values`` against a fixed category list (-1 = missing/unknown)."""
+    return pd.Categorical(values, categories=categories).codes
+
+
+class PandasBackend:
+    """In-memory backend; a selection is a sorted array of row positions."""
+
+    name = "pandas"
+
+    def __init__(self, df, locations):
+        self.df = df
+        self.locations = locations
+
+        # Hours as 0..23, with 24 standing in for unparseable times
+        self._hour = df["CRASH_HOUR"].fillna(24).to_numpy(dtype=np.int8)
+        self._injured = df["TOTAL_INJURED"].to_numpy()
+        self._killed = df["TOTAL_KILLED"].to_numpy()
+
+        self._borough_code, self._boroughs = pd.factorize(df["BOROUGH"], sort=True)
+        self._factor_code, self._factors = pd.factorize(df["TOP_FACTOR_SHORT"], sort=True)
+        # Bit c set when vehicle category c appears in any vehicle column, so a
+        # vehicle filter is one AND per row instead of a scan over every column
+        self._vehicle_bits = np.zeros(len(df), dtype=np.uint8)
+        for col in vehicle_category_cols:
+            codes = _codes(df[col], vehicle_categories)
+            self._vehicle_bits |= np.where(codes >= 0, 1 << codes.astype(np.uint8), 0).astype(np.uint8)
+        self._location = df["LOCATION_ID"].to_numpy(dtype=np.int32)
+        # Inverted index: vehicle type code -> rows listing it in any vehicle column
+        self._type_postings = _posting_lists(df[vehicle_cols])
+
+        # Days relative to the first crash date; -1 for unparseable dates
+        day = df["CRASH_DAY"].to_numpy(dtype=np.int64)
+        valid = day >= 0
+        self._day_min = int(day[valid].min()) if valid.any() else 0
+        self._day_offset = np.where(valid, day - self._day_min, -1)
+
+    def _type_rows(self, vehicle_types):
+        """Sorted positions of rows listing any of ``vehicle_types``: a posting-list union."""
+        postings = [self._type_postings[t] for t in vehicle_types if t in self._type_postings]
+        if len(postings) == 1:
+            return postings[0]
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(postings))
+
+    def _mask(self, boroughs=None, hours=None, vehicles=None, vehicle_types=None, rows=None):
+        """Which of ``rows`` (default: all rows) match the filters."""
+        take = (lambda values: values) if rows is None else (lambda values: values[rows])
+        mask = np.ones(len(self.df) if rows is None else len(rows), dtype=bool)
+
+        if boroughs:
+            # Lookup by code, with the last slot for missing boroughs (-1)
+            wanted = np.zeros(len(self._boroughs) + 1, dtype=bool)
+            wanted[self._boroughs.get_indexer(list(boroughs))] = True
+            wanted[-1] = False
+            mask &= wanted[take(self._borough_code)]
+
+        if hours:
+            hmin, hmax = hours
+            hour = take(self._hour)
+            mask &= (hour >= hmin) & (hour <= hmax)
+
+        # Row matches if ANY selected category appears in ANY vehicle column
+        if vehicles:
+            wanted = sum(1 << vehicle_categories.index(v) for v in vehicles if v in vehicle_categories)
+            mask &= (take(self._vehicle_bits) & wanted) != 0
+
+        if vehicle_types:
+            matched = np.zeros(len(self.df), dtype=bool)
+            matched[self._type_rows(vehicle_types)] = True
+            mask &= take(matched)
+
+        return mask
+
+    def select(self, boroughs=None, hours=None, vehicles=None, vehicle_types=None):
+        if vehicle_types:
+            # Start from the matching rows in the index and check the other
+            # filters on those rows only
+            rows = self._type_rows(vehicle_types)
+            return rows[self._mask(boroughs, hours, vehicles, rows=rows)]
+        return np.flatnonzero(self._mask(boroughs, hours, vehicles))
+
+    def refine(self, sel, field, value):
+        """Rows of ``sel`` whose ``field`` (a ``drill_cols`` key) equals ``value``.
+
+        Only the rows already selected are looked at.
+        """
+        if field == "hour":
+            return sel[self._hour[sel] == int(value)]
+        if field == "factor":
+            codes, labels = self._factor_code, self._factors
+        elif field == "borough":
+            codes, labels = self._borough_code, self._boroughs
+        else:
+            raise ValueError(f"Unknown drill-down field {field!r}")
+        code = labels.get_indexer([value])[0]
+        if code < 0:
+            return sel[:0]
+        return sel[codes[sel] == code]
+
+    def compare(self, scenarios):
+        """KPIs and hourly counts for each ``(boroughs, hours, vehicles, vehicle_types)`` scenario.
+
+        Rows are tagged with a bitmask of the scenarios they match and then
+        aggregated once, instead of once per scenario.
+        """
+        if len(scenarios) > MAX_SCENARIOS:
+            raise ValueError(f"At most {MAX_SCENARIOS} scenarios can be compared")
+        code = np.zeros(len(self.df), dtype=np.uint8)
+        for i, filters in enumerate(scenarios):
+            code |= self._mask(*filters).view(np.uint8) << i
+
+        # Rows in no scenario land in code 0, which no scenario sums
+        return _scenario_totals(
+            code.astype(np.intp), self._hour, None, self._injured, self._killed, len(scenarios)
+        )
+
+    def kpis(self, sel):
+        top = self.top_factors(sel, 1)
+        return {
+            "collisions": len(sel),
+            "injured": self._injured[sel].sum(),
+            "killed": self._killed[sel].sum(),
+            "top_factor": top.index[0] if len(top) else None,
+        }
+
+    def hourly_counts(self, sel):
+        return np.bincount(self._hour[sel], minlength=25)[:24]
+
+    def top_factors(self, sel, n=5):
+        codes = self._factor_code[sel]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self._factors))
+        # Stable sort over alphabetical codes: ties rank by label, as in the SQL backend
+        order = np.argsort(-counts, kind="stable")[:n]
+        order = order[counts[order] > 0]
+        return pd.Series(counts[order], index=self._factors[order], name="Count")
+
+    def borough_sums(self, sel):
+        # Missing boroughs (-1) go in the last bucket, matching groupby(dropna=False)
+        codes = self._borough_code[sel]
+        codes = np.where(codes < 0, len(self._boroughs), codes)
+        present = np.bincount(codes, minlength=len(self._boroughs) + 1) > 0
+
+        sums = {}
+        for col in injury_cols:
+            values = self.df[col].to_numpy(dtype=np.float64)[sel]
+            sums[col] = np.bincount(codes, weights=np.nan_to_num(values), minlength=len(self._boroughs) + 1)[present]
+
+        labels = np.append(self._boroughs.to_numpy(dtype=object), np.nan)[present]
+        return pd.DataFrame({"BOROUGH": labels, **sums})
+
+    def map_sample(self, sel, n=5000, seed=42):
+        # Same draw as DataFrame.sample(n, random_state=seed) on the selection
+        k = min(n, len(sel))
+        chosen = sel[np.random.RandomState(seed).choice(len(sel), size=k, replace=False)]
+        return self.df.iloc[chosen][map_cols]
+
+    def daily_counts(self, sel, start_day=None, end_day=None):
+        offsets = self._day_offset[sel]
+        valid = offsets >= 0
+        offsets, injured = offsets[valid], self._injured[sel][valid]
+        if len(offsets) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+        crashes = np.bincount(offsets)
+        injuries = np.bincount(offsets, weights=injured)
+        days = np.arange(len(crashes)) + self._day_min
+
+        # Trim to the requested window, then to the first/last crash inside it
+        in_window = crashes > 0
+        if start_day is not None:
+            in_window &= days >= start_day
+        if end_day is not None:
+            in_window &= days <= end_day
+        if not in_window.any():
+            return days[:0], crashes[:0], injuries[:0]
+        first, last = np.flatnonzero(in_window)[[0, -1]]
+        return days[first:last + 1], crashes[first:last + 1], injuries[first:last + 1]
+
+    def iter_rows(self, sel, columns, chunk_rows):
+        for start in range(0, len(sel), chunk_rows):
+            yield self.df.iloc[sel[start:start + chunk_rows]][columns]
+
+    def hotspots(self, sel, n=20):
+        ids = self._location[sel]
+        size = len(self.locations)
+        crashes = np.bincount(ids, minlength=size)
+        injured = np.bincount(ids, weights=self._injured[sel], minlength=size)
+        killed = np.bincount(ids, weights=self._killed[sel], minlength=size)
+
+        # Partition to the k-th largest count; only locations at or above it
+        # (ties included) get fully sorted
+        k = min(n, np.count_nonzero(crashes))
+        if k == 0:
+            return _with_locations(pd.DataFrame(columns=hotspot_cols), self.locations)
+        kth = np.partition(crashes, size - k)[size - k]
+        top = np.flatnonzero(crashes >= kth)
+        top = top[np.lexsort((top, -injured[top], -crashes[top]))][:k]
+
+        ranked = pd.DataFrame(
+            {"LOCATION_ID": top, "CRASHES": crashes[top], "INJURED": injured[top], "KILLED": killed[top]}
+        )
+        return _with_locations(ranked, self.locations)
+
+
+class DuckDBBackend:
+    """Embedded columnar SQL backend querying the Parquet cache in place.
+
+    A selection is a ``(where_sql, params)`` pair appended to every query.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, locations, parquet_path=PARQUET_PATH, threads=None):
+        import duckdb
+
+        if not os.path.exists(parquet_path):
+            raise FileNotFoundError(f"DuckDB backend needs the Parquet cache at {parquet_path}")
+
+        self.locations = locations
+        self._con = duckdb.connect()
+        self._con.execute(f"SET threads TO {int(threads or os.cpu_count() or 1)}")
+        self._source = "read_parquet('{}')".format(parquet_path.replace("'", "''"))
+
+    def _query(self, sql, sel, extra=()):
+        where, params = sel
+        # cursor() gives each calling thread its own handle on the shared database
+        return self._con.cursor().execute(sql.format(source=self._source, where=where), [*params, *extra])
+
+    def select(self, boroughs=None, hours=None, vehicles=None, vehicle_types=None):
+        clauses, params = ["TRUE"], []
+
+        if boroughs:
+            clauses.append(f"BOROUGH IN ({', '.join('?' * len(boroughs))})")
+            params.extend(boroughs)
+
+        if hours:
+            clauses.append("CRASH_HOUR BETWEEN ? AND ?")
+            params.extend(hours)
+
+        if vehicles:
+            placeholders = ", ".join("?" * len(vehicles))
+            clauses.append(
+                "(" + " OR ".join(f'"{col}" IN ({placeholders})' for col in vehicle_category_cols) + ")"
+            )
+            params.extend(list(vehicles) * len(vehicle_category_cols))
+
+        if vehicle_types:
+            placeholders = ", ".join("?" * len(vehicle_types))
+            clauses.append(
+                "(" + " OR ".join(f'"{col}" IN ({placeholders})' for col in vehicle_cols) + ")"
+            )
+            params.extend(list(vehicle_types) * len(vehicle_cols))
+
+        return " AND ".join(clauses), params
+
+    def refine(self, sel, field, value):
+        if field not in drill_cols:
+            raise ValueError(f"Unknown drill-down field {field!r}")
+        where, params = sel
+        return f'{where} AND "{drill_cols[field]}" = ?', [*params, int(value) if field == "hour" else value]
+
+    def compare(self, scenarios):
+        """KPIs and hourly counts for each ``(boroughs, hours, vehicles, vehicle_types)`` scenario, in one scan."""
+        if len(scenarios) > MAX_SCENARIOS:
+            raise ValueError(f"At most {MAX_SCENARIOS} scenarios can be compared")
+        terms, params = [], []
+        for i, filters in enumerate(scenarios):
+            where, where_params = self.select(*filters)
+            terms.append(f"CASE WHEN {where} THEN {1 << i} ELSE 0 END")
+            params.extend(where_params)
+
+        out = self._query(
+            "SELECT code, hour, count(*) AS c, coalesce(sum(TOTAL_INJURED), 0) AS i, "
+            "coalesce(sum(TOTAL_KILLED), 0) AS k "
+            f"FROM (SELECT {' + '.join(terms)} AS code, coalesce(CAST(CRASH_HOUR AS INTEGER), 24) AS hour, "
+            "TOTAL_INJURED, TOTAL_KILLED FROM {source}) "
+            "WHERE code > 0 GROUP BY 1, 2",
+            ("TRUE", params),
+        ).df()
+        return _scenario_totals(
+            out["code"].to_numpy(dtype=np.int64), out["hour"].to_numpy(dtype=np.int64),
+            out["c"].to_numpy(dtype=np.float64), out["i"].to_numpy(dtype=np.float64),
+            out["k"].to_numpy(dtype=np.float64), len(scenarios),
+        )
+
+    def kpis(self, sel):
+        collisions, injured, killed = self._query(
+            "SELECT count(*), coalesce(sum(TOTAL_INJURED), 0), coalesce(sum(TOTAL_KILLED), 0) "
+            "FROM {source} WHERE {where}",
+            sel,
+        ).fetchone()
+        top = self.top_factors(sel, 1)
+        return {
+            "collisions": collisions,
+            "injured": injured,
+            "killed": killed,
+            "top_factor": top.index[0] if len(top) else None,
+        }
+
+    def hourly_counts(self, sel):
+        rows = self._query(
+            "SELECT CAST(CRASH_HOUR AS INTEGER), count(*) FROM {source} "
+            "WHERE {where} AND CRASH_HOUR IS NOT NULL GROUP BY 1",
+            sel,
+        ).fetchall()
+        counts = np.zeros(24, dtype=np.int64)
+        for hour, n in rows:
+            counts[hour] = n
+        return counts
+
+    def top_factors(self, sel, n=5):
+        rows = self._query(
+            "SELECT TOP_FACTOR_SHORT, count(*) AS c FROM {source} "
+            "WHERE {where} AND TOP_FACTOR_SHORT IS NOT NULL "
+            "GROUP BY 1 ORDER BY c DESC, 1 LIMIT ?",
+            sel,
+            extra=(n,),
+        ).fetchall()
+        return pd.Series([c for _, c in rows], index=[f for f, _ in rows], name="Count", dtype=np.int64)
+
+    def borough_sums(self, sel):
+        sums = ", ".join(f'coalesce(sum("{col}"), 0) AS "{col}"' for col in injury_cols)
+        out = self._query(
+            f"SELECT BOROUGH, {sums} FROM {{source}} WHERE {{where}} "
+            "GROUP BY BOROUGH ORDER BY BOROUGH NULLS LAST",
+            sel,
+        ).df()
+        out[injury_cols] = out[injury_cols].astype(np.float64)
+        return out
+
+    def map_sample(self, sel, n=5000, seed=42):
+        cols = ", ".join(f'"{col}"' for col in map_cols)
+        return self._query(
+            f"SELECT {cols} FROM (SELECT {cols} FROM {{source}} WHERE {{where}}) "
+            f"USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})",
+            sel,
+        ).df()
+
+    def daily_counts(self, sel, start_day=None, end_day=None):
+        window, extra = "", []
+        if start_day is not None:
+            window += " AND CRASH_DAY >= ?"
+            extra.append(int(start_day))
+        if end_day is not None:
+            window += " AND CRASH_DAY <= ?"
+            extra.append(int(end_day))
+        out = self._query(
+            "SELECT CRASH_DAY, count(*) AS c, coalesce(sum(TOTAL_INJURED), 0) AS i FROM {source} "
+            f"WHERE {{where}} AND CRASH_DAY >= 0{window} GROUP BY 1 ORDER BY 1",
+            sel,
+            extra=extra,
+        ).df()
+        if out.empty:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Fill days without crashes so the series is evenly spaced
+        days = np.arange(out["CRASH_DAY"].iloc[0], out["CRASH_DAY"].iloc[-1] + 1)
+        crashes = np.zeros(len(days), dtype=np.int64)
+        injuries = np.zeros(len(days))
+        crashes[out["CRASH_DAY"] - days[0]] = out["c"]
+        injuries[out["CRASH_DAY"] - days[0]] = out["i"]
+        return days, crashes, injuries
+
+    def iter_rows(self, sel, columns, chunk_rows):
+        cols = ", ".join(f'"{col}"' for col in columns)
+        # Hold the cursor for as long as its reader is being consumed
+        cursor = self._query(f"SELECT {cols} FROM {{source}} WHERE {{where}}", sel)
+        for batch in cursor.fetch_record_batch(chunk_rows):
+            yield batch.to_pandas()
+
+    def hotspots(self, sel, n=20):
+        ranked = self._query(
+            "SELECT LOCATION_ID, count(*) AS CRASHES, "
+            "coalesce(sum(TOTAL_INJURED), 0) AS INJURED, coalesce(sum(TOTAL_KILLED), 0) AS KILLED "
+            "FROM {source} WHERE {where} "
+            "GROUP BY LOCATION_ID ORDER BY CRASHES DESC, INJURED DESC, LOCATION_ID LIMIT ?",
+            sel,
+            extra=(n,),
+        ).df()
+        return _with_locations(ranked, self.locations)
+
+
+def make_backend(name, df, locations, parquet_path=PARQUET_PATH):
+    if name == "pandas":
+        return PandasBackend(df, locations)
+    if name == "duckdb":
+        return DuckDBBackend(locations, parquet_path)
+    raise ValueError(f"Unknown QUERY_BACKEND {name!r} (expected 'pandas' or 'duckdb')")
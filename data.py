@@ -0,0 +1,468 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CSV_PATH = os.environ.get("CRASHES_CSV", "Motor_Vehicle_Collisions_Crashes.csv")
+# Prepared (derived columns included) copy of the CSV, rebuilt when the CSV changes
+PARQUET_PATH = os.environ.get("CRASHES_PARQUET", os.path.splitext(CSV_PATH)[0] + ".parquet")
+
+factor_cols = [
+    "CONTRIBUTING FACTOR VEHICLE 1",
+    "CONTRIBUTING FACTOR VEHICLE 2",
+    "CONTRIBUTING FACTOR VEHICLE 3",
+    "CONTRIBUTING FACTOR VEHICLE 4",
+    "CONTRIBUTING FACTOR VEHICLE 5",
+]
+
+# Short label mapping for contributing factors
+factor_mapping = {
+    "Accelerator Defective": "Accel Defect",
+    "Aggressive Driving/Road Rage": "Aggressive/Road Rage",
+    "Alcohol Involvement": "Alcohol",
+    "Animals Action": "Animals",
+    "Backing Unsafely": "Backing Unsafe",
+    "Brakes Defective": "Brake Defect",
+    "Cell Phone (hand-Held)": "Phone (Handheld)",
+    "Cell Phone (hands-free)": "Phone (Hands-free)",
+    "Driver Inattention/Distraction": "Driver Distracted",
+    "Driver Inexperience": "Inexperienced",
+    "Driverless/Runaway Vehicle": "Runaway Vehicle",
+    "Drugs (illegal)": "Drugs",
+    "Eating or Drinking": "Eating/Drinking",
+    "Failure to Keep Right": "Didn't Keep Right",
+    "Failure to Yield Right-of-Way": "Didn't Yield",
+    "Fatigued/Drowsy": "Fatigued",
+    "Fell Asleep": "Fell Asleep",
+    "Following Too Closely": "Tailgating",
+    "Glare": "Glare",
+    "Headlights Defective": "Headlight Defect",
+    "Illnes": "Illness",
+    "Lane Marking Improper/Inadequate": "Bad Lane Markings",
+    "Listening/Using Headphones": "Using Headphones",
+    "Lost Consciousness": "Lost Consciousness",
+    "Obstruction/Debris": "Obstruction",
+    "Other Electronic Device": "Other Device",
+    "Other Lighting Defects": "Lighting Defect",
+    "Other Vehicular": "Other Vehicular",
+    "Outside Car Distraction": "Outside Distract.",
+    "Oversized Vehicle": "Oversized",
+    "Passenger Distraction": "Passenger Distract.",
+    "Passing Too Closely": "Close Passing",
+    "Passing or Lane Usage Improper": "Bad Lane Use",
+    "Pavement Defective": "Pavement Defect",
+    "Pavement Slippery": "Slippery Pavement",
+    "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion": "Ped/Bike Conf.",
+    "Physical Disability": "Disability",
+    "Prescription Medication": "Medication",
+    "Reaction to Uninvolved Vehicle": "Reacted to Other",
+    "Shoulders Defective/Improper": "Bad Shoulder",
+    "Steering Failure": "Steering Failure",
+    "Texting": "Texting",
+    "Tinted Windows": "Tinted",
+    "Tire Failure/Inadequate": "Tire Failure",
+    "Tow Hitch Defective": "Tow Hitch",
+    "Traffic Control Device Improper/Non-Working": "Bad Signal",
+    "Traffic Control Disregarded": "Ignored Signal",
+    "Turning Improperly": "Bad Turn",
+    "Unsafe Lane Changing": "Unsafe Lane Change",
+    "Unsafe Speed": "Unsafe Speed",
+    "Using On Board Navigation Device": "Using Nav",
+    "Vehicle Vandalism": "Vandalism",
+    "View Obstructed/Limited": "View Blocked",
+    "Windshield Inadequate": "Bad Windshield",
+}
+
+vehicle_cols = [
+    "VEHICLE TYPE CODE 1",
+    "VEHICLE TYPE CODE 2",
+    "VEHICLE TYPE CODE 3",
+    "VEHICLE TYPE CODE 4",
+    "VEHICLE TYPE CODE 5",
+]
+vehicle_category_cols = [col + "_CATEGORY" for col in vehicle_cols]
+vehicle_categories = ["car", "motorcycle", "truck", "other"]
+
+# Column types for the Arrow CSV reader; anything not listed is inferred
+csv_text_cols = [
+    "CRASH DATE",
+    "CRASH TIME",
+    "BOROUGH",
+    "ZIP CODE",
+    "ON STREET NAME",
+    "CROSS STREET NAME",
+    "OFF STREET NAME",
+    *factor_cols,
+    *vehicle_cols,
+]
+csv_float_cols = ["LATITUDE", "LONGITUDE"]
+csv_int_cols = ["COLLISION_ID"]
+# Read as floats, then narrowed to int64 when no value is blank or fractional
+csv_count_cols = [
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PERSONS KILLED",
+    "NUMBER OF PEDESTRIANS INJURED",
+    "NUMBER OF PEDESTRIANS KILLED",
+    "NUMBER OF CYCLIST INJURED",
+    "NUMBER OF CYCLIST KILLED",
+    "NUMBER OF MOTORIST INJURED",
+    "NUMBER OF MOTORIST KILLED",
+]
+
+# Columns prepare_crashes adds; a cache missing any of them is rebuilt
+derived_cols = [
+    "CRASH_HOUR",
+    "CRASH_DAY",
+    "TOTAL_INJURED",
+    "TOTAL_KILLED",
+    "TOP_FACTOR",
+    "TOP_FACTOR_SHORT",
+    *vehicle_category_cols,
+    "LOCATION_ID",
+]
+
+def classify_vehicle(v):
+    if pd.isna(v):
+        return "other"
+    
+    v_low = str(v).lower().strip()
+
+    # MOTORCYCLE CATEGORY
+    motorcycle_keywords = [
+        "motorcycle", "motorbike", "scooter", "moped", "dirt", "bike",
+        "bicycle", "citibike", "mini", "hover", "skate", "unic", "one wheel",
+        "e-bike", "ebike", "e bike", "e-scooter", "escooter", "e scooter",
+        "kick", "stand", "razor"
+    ]
+    if any(k in v_low for k in motorcycle_keywords):
+        return "motorcycle"
+
+    # TRUCK CATEGORY
+    truck_keywords = [
+        "truck", "van", "bus", "ambul", "fire", "fdny", "usps", "box",
+        "freight", "dump", "tractor", "semi", "delivery", "tow",
+        "sweep", "cement", "mixer", "fork", "lift", "backhoe",
+        "construction", "cargo", "commercial", "flat", "pick", "pickup",
+        "uhaul", "sanitation", "loader", "bobcat", "plow", "snow",
+        "armored", "atv", "toolcat"
+    ]
+    if any(k in v_low for k in truck_keywords):
+        return "truck"
+
+    # TRUE CAR CATEGORY (strict definitions)
+    car_keywords = [
+        "sedan", "station wagon", "sport utility", "suv", "suburban",
+        "passenger", "4 dr", "2 dr", "coupe", "convertible", "hatch",
+        "minivan", "wagon"
+    ]
+    if any(k in v_low for k in car_keywords):
+        return "car"
+
+    # EVERYTHING ELSE → OTHER
+    return "other"
+
+
+def read_crashes_pandas(path=CSV_PATH):
+    """Single-threaded ``read_crashes_arrow`` for when pyarrow is not installed."""
+    df = pd.read_csv(path, low_memory=False)
+
+    df["CRASH_HOUR"] = pd.to_datetime(df["CRASH TIME"], format="%H:%M", errors="coerce").dt.hour
+    # Days since 1970-01-01 as int32 (-1 where the date does not parse)
+    crash_date = pd.to_datetime(df["CRASH DATE"], format="%m/%d/%Y", errors="coerce")
+    df["CRASH_DAY"] = (
+        ((crash_date - pd.Timestamp("1970-01-01")) // pd.Timedelta(days=1)).fillna(-1).astype("int32")
+    )
+    return df.dropna(subset=["LATITUDE", "LONGITUDE"]), len(df)
+
+
+def read_crashes_arrow(path=CSV_PATH):
+    """Parse the CSV on all cores with pyarrow and filter it before it becomes a DataFrame.
+
+    CRASH_HOUR, CRASH_DAY and the coordinate filter are computed with Arrow
+    kernels on the typed columns, so the time and date strings are parsed
+    once and rows without coordinates are never converted. Returns the
+    DataFrame and the number of rows read.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv
+
+    column_types = {
+        **{col: pa.string() for col in csv_text_cols},
+        **{col: pa.float64() for col in [*csv_float_cols, *csv_count_cols]},
+        **{col: pa.int64() for col in csv_int_cols},
+    }
+    table = csv.read_csv(
+        path,
+        read_options=csv.ReadOptions(use_threads=True),
+        convert_options=csv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+
+    rows_read = table.num_rows
+    for col in csv_count_cols:
+        values = table[col]
+        if values.null_count == 0 and pc.all(pc.equal(pc.floor(values), values)).as_py():
+            table = table.set_column(table.schema.get_field_index(col), col, pc.cast(values, pa.int64()))
+
+    # Same rows as dropna(subset=[LATITUDE, LONGITUDE]): nulls and NaNs go
+    lat, lon = table["LATITUDE"], table["LONGITUDE"]
+    table = table.filter(pc.and_(pc.invert(pc.is_nan(lat)), pc.invert(pc.is_nan(lon))))
+
+    crash_time = pc.strptime(table["CRASH TIME"], format="%H:%M", unit="s", error_is_null=True)
+    table = table.append_column("CRASH_HOUR", pc.cast(pc.hour(crash_time), pa.int32()))
+
+    # strptime rolls impossible dates (02/30) over into the next month, so
+    # also require the parsed day of month to be the one that was written
+    dates = table["CRASH DATE"]
+    crash_date = pc.strptime(dates, format="%m/%d/%Y", unit="s", error_is_null=True)
+    written_day = pc.cast(pc.struct_field(pc.extract_regex(dates, r"^\d{1,2}/(?P<day>\d{1,2})/"), [0]), pa.int64())
+    valid = pc.fill_null(pc.equal(pc.day(crash_date), written_day), False)
+    days = pc.cast(pc.cast(crash_date, pa.date32()), pa.int32())
+    table = table.append_column("CRASH_DAY", pc.fill_null(pc.if_else(valid, days, None), -1))
+
+    return table.to_pandas(), rows_read
+
+
+def read_crashes(path=CSV_PATH):
+    """Read the raw CSV with CRASH_HOUR and CRASH_DAY added and rows without coordinates dropped.
+
+    Returns the DataFrame and the ingest rate in rows read per second.
+    """
+    started = time.perf_counter()
+    try:
+        (df, rows_read), reader = read_crashes_arrow(path), "pyarrow"
+    except ImportError:
+        (df, rows_read), reader = read_crashes_pandas(path), "pandas"
+    seconds = time.perf_counter() - started
+    # Logged on every cold build, to compare ingest speed across machines
+    logger.info(
+        "Ingested %d rows from %s in %.1fs (%.0f rows/s, %s reader); %d have coordinates",
+        rows_read, path, seconds, rows_read / max(seconds, 1e-9), reader, len(df),
+    )
+    return df, rows_read / max(seconds, 1e-9)
+
+
+def prepare_crashes(path=CSV_PATH):
+    """Read the raw collisions CSV and add the derived dashboard columns.
+
+    ``df.attrs["ingest_rows_per_second"]`` records how fast the CSV was parsed.
+    """
+    df, rows_per_second = read_crashes(path)
+
+    df["TOTAL_INJURED"] = df["NUMBER OF PERSONS INJURED"].fillna(0)
+    df["TOTAL_KILLED"] = df["NUMBER OF PERSONS KILLED"].fillna(0)
+
+    df["TOP_FACTOR"] = df[factor_cols].bfill(axis=1).iloc[:, 0]
+    df["TOP_FACTOR_SHORT"] = df["TOP_FACTOR"].map(factor_mapping).fillna(df["TOP_FACTOR"])
+
+    for col in vehicle_cols:
+        df[col + "_CATEGORY"] = df[col].apply(classify_vehicle)
+
+    df["LOCATION_ID"] = pd.factorize(location_keys(df))[0].astype("int32")
+
+    df.attrs["ingest_rows_per_second"] = rows_per_second
+    return df
+
+
+# Grid steps (degrees) used to place crashes that have no usable street
+# names (~100m), and to split a single named street into segments (~500m)
+POINT_SNAP = 0.001
+SEGMENT_SNAP = 0.005
+
+
+def _snap(values, step):
+    return np.char.mod("%.3f", np.round(values / step) * step)
+
+
+def _street(series):
+    return series.fillna("").astype(str).str.upper().str.split().str.join(" ")
+
+
+def location_keys(df):
+    """Canonical location label for every crash.
+
+    Two named streets make an intersection ("A & B", order-independent); a
+    single name becomes a segment of that street; otherwise the crash is
+    keyed by its snapped coordinates.
+    """
+    on = _street(df["ON STREET NAME"]).to_numpy(dtype=object)
+    cross = _street(df["CROSS STREET NAME"]).to_numpy(dtype=object)
+    lat = df["LATITUDE"].to_numpy(dtype=np.float64)
+    lon = df["LONGITUDE"].to_numpy(dtype=np.float64)
+
+    lo = np.where(on <= cross, on, cross)
+    hi = np.where(on <= cross, cross, on)
+    intersection = pd.Series(lo) + " & " + pd.Series(hi)
+
+    street = np.where(on != "", on, cross)
+    segment = (
+        pd.Series(street) + " (near " + _snap(lat, SEGMENT_SNAP) + ", " + _snap(lon, SEGMENT_SNAP) + ")"
+    )
+    point = "Near " + pd.Series(_snap(lat, POINT_SNAP)) + ", " + pd.Series(_snap(lon, POINT_SNAP))
+
+    keys = np.where(
+        (on != "") & (cross != "") & (on != cross),
+        intersection,
+        np.where(street != "", segment, point),
+    )
+    return pd.Series(keys, index=df.index)
+
+
+def build_locations(df):
+    """Lookup table from LOCATION_ID to label, borough and mean position."""
+    first = df.drop_duplicates("LOCATION_ID")
+    locations = df.groupby("LOCATION_ID").agg(
+        BOROUGH=("BOROUGH", "first"),
+        LATITUDE=("LATITUDE", "mean"),
+        LONGITUDE=("LONGITUDE", "mean"),
+    )
+    locations["LOCATION"] = pd.Series(location_keys(first).to_numpy(), index=first["LOCATION_ID"].to_numpy())
+    return locations
+
+
+def stringify_objects(df):
+    """Shallow copy of ``df`` with object columns holding only strings or nulls.
+
+    low_memory=False leaves mixed str/int object columns (e.g. ZIP CODE),
+    which Arrow refuses to infer a type for.
+    """
+    out = df.copy(deep=False)
+    # pandas stores attrs in the Parquet metadata; ingest stats describe this
+    # process's build, not the cached file
+    out.attrs = {}
+    for col in out.select_dtypes(include="object").columns:
+        out[col] = out[col].where(out[col].isna(), out[col].astype(str))
+    return out
+
+
+def write_parquet(df, path=PARQUET_PATH):
+    """Write the cache to a temporary file and swap it in, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        stringify_objects(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_crashes(csv_path=CSV_PATH, parquet_path=PARQUET_PATH):
+    """Return the prepared dataset, reusing the Parquet cache when it is fresh."""
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+    ):
+        df = pd.read_parquet(parquet_path)
+        if set(derived_cols) <= set(df.columns):
+            return df
+        logger.info("Parquet cache at %s predates new derived columns; rebuilding", parquet_path)
+
+    df = prepare_crashes(csv_path)
+    try:
+        write_parquet(df, parquet_path)
+    except (ImportError, OSError):
+        logger.warning("Could not write Parquet cache to %s", parquet_path, exc_info=True)
+    return df
+
+
+def dataset_version(csv_path=CSV_PATH, parquet_path=PARQUET_PATH):
+    """Short token that changes whenever the source data file changes."""
+    path = csv_path if os.path.exists(csv_path) else parquet_path
+    st = os.stat(path)
+    return f"{int(st.st_mtime):x}-{st.st_size:x}"
+
+
+class DataStore:
+    """Holds the prepared dataset and loads it on a background thread.
+
+    The web server can answer requests (health checks, the loading page)
+    while the CSV is still being parsed; ``ready`` flips once ``df`` and the
+    derived option lists are available.
+    """
+
+    def __init__(self, loader=load_crashes, backend="pandas", precomputed=None):
+        self._loader = loader
+        self._backend_name = backend
+        self._precomputed_path = precomputed
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.df = None
+        self.locations = None
+        self.backend = None
+        self.sample = None
+        self.precomputed = {}
+        self.vehicle_types = []
+        self.borough_options = []
+        self.error = None
+        self.load_seconds = None
+        # Set when this process built the dataset from the CSV, None on a cache hit
+        self.ingest_rows_per_second = None
+        self.version = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="crash-data-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            from backends import make_backend
+            from sampling import StratifiedSample
+
+            version = dataset_version()
+            df = self._loader()
+            locations = build_locations(df)
+            backend = make_backend(self._backend_name, df, locations)
+            sample = StratifiedSample(df, locations)
+        except Exception as exc:
+            self.error = exc
+            logger.exception("Failed to load crash data")
+            return
+
+        if self._precomputed_path:
+            self.precomputed = self._load_precomputed(version)
+
+        self.vehicle_types = sorted(list({v for col in vehicle_cols for v in df[col].dropna().unique()}))
+        self.borough_options = sorted(df["BOROUGH"].dropna().unique())
+        self.df = df
+        self.locations = locations
+        self.backend = backend
+        self.sample = sample
+        self.version = version
+        self.ingest_rows_per_second = df.attrs.get("ingest_rows_per_second")
+        self.load_seconds = time.perf_counter() - started
+        logger.info("Loaded %d crash records in %.1fs (%s backend)", len(df), self.load_seconds, backend.name)
+        self._ready.set()
+
+    def _load_precomputed(self, version):
+        from queries import read_results
+
+        try:
+            results_version, results = read_results(self._precomputed_path)
+        except (ImportError, OSError, ValueError, KeyError):
+            logger.warning("Could not read precomputed results from %s", self._precomputed_path, exc_info=True)
+            return {}
+        if results_version != version:
+            # Built from another copy of the data; serving it would be wrong
+            logger.warning("Ignoring precomputed results in %s: they are for a different dataset", self._precomputed_path)
+            return {}
+        logger.info("Serving %d precomputed selections from %s", len(results), self._precomputed_path)
+        return results
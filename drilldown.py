@@ -0,0 +1,75 @@
+"""Cross-filter drill-down on top of the dashboard filters.
+
+Clicking a chart adds a constraint (a factor, a borough or an hour) to the
+session's drill-down path. Every constraint only narrows the selection, so
+``SessionSelections`` remembers the last selection each browser session
+asked for and applies just the newly added constraints to it, instead of
+selecting from the full dataset again.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Memory the cached selections may use across all sessions
+DRILLDOWN_CACHE_MB = int(os.environ.get("DRILLDOWN_CACHE_MB", 256))
+
+drill_fields = ("factor", "borough", "hour")
+
+
+def drill_key(drill):
+    """Hashable drill-down path from ``[field, value]`` pairs, skipping unknown fields."""
+    return tuple(
+        (field, int(value) if field == "hour" else value)
+        for field, value in drill or ()
+        if field in drill_fields
+    )
+
+
+def refine_all(backend, sel, drill):
+    for field, value in drill:
+        sel = backend.refine(sel, field, value)
+    return sel
+
+
+class _Entry:
+    def __init__(self, key, drill, sel):
+        self.key = key
+        self.drill = drill
+        self.sel = sel
+        # DuckDB selections are SQL strings, not row arrays
+        self.nbytes = getattr(sel, "nbytes", 0)
+
+
+class SessionSelections:
+    """Last selection per session, for a bounded amount of memory."""
+
+    def __init__(self, max_bytes=DRILLDOWN_CACHE_MB * 2**20):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._max_bytes = max_bytes
+
+    def get(self, backend, session, key, drill):
+        """Selection for filter ``key`` narrowed by ``drill``, reusing the session's last one."""
+        with self._lock:
+            last = self._entries.get(session)
+
+        if last is not None and last.key == key and drill[:len(last.drill)] == last.drill:
+            sel = refine_all(backend, last.sel, drill[len(last.drill):])
+        else:
+            sel = refine_all(backend, backend.select(*key), drill)
+
+        if session is not None:
+            self._put(session, _Entry(key, drill, sel))
+        return sel
+
+    def _put(self, session, entry):
+        with self._lock:
+            old = self._entries.pop(session, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[session] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
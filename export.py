@@ -0,0 +1,90 @@
+"""Streaming serializers for exporting the filtered crash records.
+
+Rows come from the query backend in fixed-size chunks and each chunk is
+encoded and handed to the response before the next one is read, so the
+memory used by an export does not grow with the size of the selection.
+"""
+import os
+
+import numpy as np
+
+from data import derived_cols, stringify_objects
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 50_000))
+
+export_formats = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_columns(df):
+    """The source dataset columns, without the dashboard's helper columns."""
+    return [col for col in df.columns if col not in derived_cols]
+
+
+def iter_csv(chunks, columns):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode()
+        header = False
+    if header:
+        yield (",".join(columns) + "\n").encode()
+
+
+class _StreamSink:
+    """Write-only file object for ParquetWriter whose buffer is drained between chunks."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records absolute column-chunk offsets, so this keeps
+        # counting even though drained bytes are gone
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _arrow_schema(dtypes):
+    import pyarrow as pa
+
+    return pa.schema(
+        [(col, pa.string() if dtype == np.dtype(object) else pa.from_numpy_dtype(dtype)) for col, dtype in dtypes.items()]
+    )
+
+
+def iter_parquet(chunks, dtypes):
+    """Encode each chunk as a Parquet row group; ``dtypes`` fixes the schema up front."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(dtypes)
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(stringify_objects(chunk), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,46 @@
+"""Largest-Triangle-Three-Buckets downsampling for time series.
+
+Reduces a series to a fixed number of points while keeping its visual
+shape (peaks, troughs, trend changes), so long daily histories can be
+sent to the browser at a bounded size.
+"""
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Indices of the ``threshold`` points LTTB keeps from ``(x, y)``.
+
+    ``x`` must be sorted. The first and last points are always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    # Interior points split into threshold - 2 buckets of (n - 2) / (threshold - 2)
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Average of the next bucket (just the last point, for the final bucket)
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point forming the largest triangle with the previous pick
+        # and the next bucket's average
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return keep
@@ -0,0 +1,119 @@
+"""Dashboard queries as plain Python data, independent of Dash.
+
+``dashboard_summary`` computes every aggregate the dashboard shows for one
+filter selection and returns it as numbers, strings, lists and dicts, so
+scripts and the offline reports (see ``report.py``) use the same logic as
+the UI. Results for many selections can be saved with ``write_results``
+and served back by the dashboard through ``PRECOMPUTED_RESULTS``.
+"""
+import json
+import os
+
+import numpy as np
+
+from drilldown import drill_key, refine_all
+
+HOTSPOT_COUNT = 20
+TOP_FACTOR_COUNT = 5
+
+# Results file written by report.py; selections found in it are served
+# from the file instead of being recomputed
+PRECOMPUTED_RESULTS = os.environ.get("PRECOMPUTED_RESULTS")
+
+# Hour-of-day ranges the offline reports precompute; (0, 23) is the
+# dashboard's default, whole-day slider position
+HOUR_BUCKETS = [(0, 23), (0, 5), (6, 11), (12, 17), (18, 23)]
+
+
+def filter_key(selected_boroughs, selected_hours, selected_vehicles, selected_vehicle_types=None):
+    """Normalized, hashable form of the dashboard filters."""
+    return (
+        tuple(sorted(selected_boroughs or ())),
+        tuple(selected_hours) if selected_hours else None,
+        tuple(sorted(selected_vehicles or ())),
+        tuple(sorted(selected_vehicle_types or ())),
+    )
+
+
+def _native(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _records(df):
+    """Rows of ``df`` as dicts of plain values, with missing values as None."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def dashboard_summary(backend, boroughs=None, hours=None, vehicles=None, vehicle_types=None, drill=(),
+                      hotspot_count=HOTSPOT_COUNT):
+    """Every aggregate shown on the dashboard for one filter selection.
+
+    ``drill`` is a drill-down path of ``(field, value)`` constraints, as
+    built by clicking the charts.
+    """
+    sel = refine_all(backend, backend.select(boroughs, hours, vehicles, vehicle_types), drill_key(drill))
+    return summarize_selection(backend, sel, hotspot_count)
+
+
+def summarize_selection(backend, sel, hotspot_count=HOTSPOT_COUNT):
+    """``dashboard_summary`` for a selection the backend has already made."""
+    kpis = backend.kpis(sel)
+    top_factors = backend.top_factors(sel, TOP_FACTOR_COUNT)
+    return {
+        "collisions": int(kpis["collisions"]),
+        "injured": _native(kpis["injured"]),
+        "killed": _native(kpis["killed"]),
+        "top_factor": kpis["top_factor"],
+        "hourly": [int(n) for n in backend.hourly_counts(sel)],
+        "top_factors": [{"factor": f, "count": int(n)} for f, n in top_factors.items()],
+        "borough_injuries": _records(backend.borough_sums(sel)),
+        "hotspots": _records(backend.hotspots(sel, hotspot_count)),
+    }
+
+
+def report_combinations(borough_options, vehicle_categories):
+    """Every borough x hour bucket x vehicle category selection, each also as "all".
+
+    Individual vehicle types are left out; there are too many to enumerate.
+    """
+    return [
+        (boroughs, list(hours), vehicles)
+        for boroughs in [[]] + [[b] for b in borough_options]
+        for hours in HOUR_BUCKETS
+        for vehicles in [[]] + [[v] for v in vehicle_categories]
+    ]
+
+
+def write_results(records, path, version):
+    """Save ``records`` (filters plus summary, one dict per selection) as JSON or Parquet."""
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(records).replace_schema_metadata({"version": version})
+        pq.write_table(table, path)
+    else:
+        with open(path, "w") as f:
+            json.dump({"version": version, "results": records}, f)
+
+
+def read_results(path):
+    """Load a results file as ``(version, {filter_key: summary})``."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        version = (table.schema.metadata or {}).get(b"version", b"").decode()
+        records = table.to_pylist()
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        version, records = data["version"], data["results"]
+
+    results = {}
+    for record in records:
+        key = filter_key(
+            record.pop("boroughs"), record.pop("hours"), record.pop("vehicles"), record.pop("vehicle_types", None)
+        )
+        results[key] = record
+    return version, results
@@ -0,0 +1,84 @@
+"""Precompute dashboard results for every borough x hour bucket x vehicle selection.
+
+    python report.py reports/crashes.json
+    python report.py reports/crashes.parquet --workers 8
+
+The dataset is loaded once in this process; the worker processes are
+forked from it and share the loaded data instead of each reading it
+again. Point the dashboard's ``PRECOMPUTED_RESULTS`` at the output file to
+serve these selections without recomputing them.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backends import QUERY_BACKEND, make_backend
+from data import build_locations, dataset_version, load_crashes, vehicle_categories
+from queries import dashboard_summary, report_combinations, write_results
+
+logger = logging.getLogger("report")
+
+# Loaded data, set before the pool starts so forked workers inherit it
+_shared = {}
+
+
+def _init_worker(backend_name):
+    if "backend" in _shared:
+        # Inherited from the parent over fork
+        return
+    if "df" not in _shared:
+        # Spawned rather than forked: nothing was inherited
+        _shared["df"] = load_crashes()
+        _shared["locations"] = build_locations(_shared["df"])
+    # DuckDB connections can't cross a fork, so each worker opens its own
+    _shared["backend"] = make_backend(backend_name, _shared["df"], _shared["locations"])
+
+
+def _summarize(filters):
+    boroughs, hours, vehicles = filters
+    return {
+        "boroughs": boroughs,
+        "hours": hours,
+        "vehicles": vehicles,
+        "vehicle_types": [],
+        **dashboard_summary(_shared["backend"], boroughs, hours, vehicles),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="results file to write (.json or .parquet)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--backend", default=QUERY_BACKEND, choices=["pandas", "duckdb"])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    started = time.perf_counter()
+
+    version = dataset_version()
+    df = load_crashes()
+    _shared["df"] = df
+    _shared["locations"] = build_locations(df)
+    if args.backend == "pandas":
+        _shared["backend"] = make_backend(args.backend, df, _shared["locations"])
+    logger.info("Loaded %d crash records in %.1fs", len(df), time.perf_counter() - started)
+
+    combinations = report_combinations(sorted(df["BOROUGH"].dropna().unique()), vehicle_categories)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(args.backend,)) as pool:
+        records = list(pool.map(_summarize, combinations, chunksize=4))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    write_results(records, args.output, version)
+    logger.info("Wrote %d selections to %s in %.1fs", len(records), args.output, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
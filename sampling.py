@@ -0,0 +1,91 @@
+"""Fixed stratified sample for fast approximate dashboard results.
+
+The sample is drawn once at load time, stratified by borough x hour of day
+(the two filters that split the data most unevenly), with proportional
+allocation and a floor per stratum. Estimates use the standard stratified
+expansion estimator; the reported bounds are normal-approximation 95%
+confidence intervals.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from backends import PandasBackend
+from drilldown import refine_all
+
+SAMPLE_ROWS = int(os.environ.get("SAMPLE_ROWS", 100_000))
+MIN_PER_STRATUM = 30
+Z_95 = 1.96
+
+
+class StratifiedSample:
+    def __init__(self, df, locations, size=SAMPLE_ROWS, seed=0):
+        borough_code = pd.factorize(df["BOROUGH"], sort=True)[0] + 1
+        hour_code = df["CRASH_HOUR"].fillna(24).to_numpy(dtype=np.int64)
+        strata = borough_code * 25 + hour_code
+        strata, _ = pd.factorize(strata)
+
+        population = np.bincount(strata)
+        allocation = np.maximum(np.round(size * population / len(df)), MIN_PER_STRATUM)
+        allocation = np.minimum(allocation, population).astype(np.int64)
+
+        # Random order, grouped by stratum; keep the first n_h of each group
+        order = np.random.RandomState(seed).permutation(len(df))
+        order = order[np.argsort(strata[order], kind="stable")]
+        starts = np.concatenate([[0], np.cumsum(population)[:-1]])
+        rank = np.arange(len(df)) - starts[strata[order]]
+        positions = np.sort(order[rank < allocation[strata[order]]])
+
+        self.rows = PandasBackend(df.iloc[positions], locations)
+        self.size = len(positions)
+        self._stratum = strata[positions]
+        self._population = population
+        self._allocation = allocation
+        self._weight = (population / allocation)[self._stratum]
+
+        sample = df.iloc[positions]
+        self._hour = sample["CRASH_HOUR"].fillna(24).to_numpy(dtype=np.int64)
+        self._injured = sample["TOTAL_INJURED"].to_numpy(dtype=np.float64)
+        self._killed = sample["TOTAL_KILLED"].to_numpy(dtype=np.float64)
+        self._factor_code, self._factors = pd.factorize(sample["TOP_FACTOR_SHORT"], sort=True)
+
+    def _total(self, z):
+        """Estimated population total of ``z`` and its 95% CI half-width."""
+        strata = len(self._population)
+        n = self._allocation
+        N = self._population
+        sums = np.bincount(self._stratum, weights=z, minlength=strata)
+        squares = np.bincount(self._stratum, weights=z * z, minlength=strata)
+
+        estimate = np.sum(N / n * sums)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s2 = np.where(n > 1, (squares - sums * sums / n) / (n - 1), 0.0)
+        variance = np.sum(N * N * (1 - n / N) * s2 / n)
+        return estimate, Z_95 * np.sqrt(max(variance, 0.0))
+
+    def estimate(self, boroughs=None, hours=None, vehicles=None, vehicle_types=None, drill=(), top_n=5):
+        """Approximate KPIs, hourly counts and factor shares for the filters.
+
+        Every value is an ``(estimate, ci_half_width)`` pair.
+        """
+        selected = np.zeros(self.size, dtype=bool)
+        selected[refine_all(self.rows, self.rows.select(boroughs, hours, vehicles, vehicle_types), drill)] = True
+        in_domain = selected.astype(np.float64)
+
+        collisions = self._total(in_domain)
+        hourly = [self._total(in_domain * (self._hour == h)) for h in range(24)]
+
+        codes = self._factor_code[selected]
+        weighted = np.bincount(codes[codes >= 0], weights=self._weight[selected][codes >= 0], minlength=len(self._factors))
+        top = np.argsort(-weighted, kind="stable")[:top_n]
+        top = top[weighted[top] > 0]
+        factors = {self._factors[code]: self._total(in_domain * (self._factor_code == code)) for code in top}
+
+        return {
+            "collisions": collisions,
+            "injured": self._total(in_domain * self._injured),
+            "killed": self._total(in_domain * self._killed),
+            "hourly": hourly,
+            "factors": factors,
+        }
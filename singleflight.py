@@ -0,0 +1,88 @@
+"""Coalescing of identical concurrent computations.
+
+``SingleFlight`` lets concurrent callers that ask for the same key share
+one in-progress computation. ``LatestRequests`` remembers the newest
+request per browser session so that older ones still waiting for a
+compute slot can be dropped instead of computed.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+
+class Superseded(Exception):
+    """Raised when a newer request from the same session has arrived."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run ``fn`` once per key at a time; concurrent callers wait for that run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                try:
+                    call.result = fn()
+                except BaseException as exc:
+                    call.error = exc
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+                return call.result
+
+            call.done.wait()
+            if isinstance(call.error, Superseded):
+                # Only the leader's own session moved on; someone else
+                # still wants this result, so take over the computation
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+
+class LatestRequests:
+    """Newest request token per session, for a bounded number of sessions."""
+
+    def __init__(self, max_sessions=10_000):
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._tokens = itertools.count()
+        self._max_sessions = max_sessions
+
+    def begin(self, session):
+        token = next(self._tokens)
+        if session is None:
+            return token
+        with self._lock:
+            self._latest[session] = token
+            self._latest.move_to_end(session)
+            while len(self._latest) > self._max_sessions:
+                self._latest.popitem(last=False)
+        return token
+
+    def check(self, session, token):
+        """Raise ``Superseded`` if ``session`` has issued a newer request than ``token``."""
+        if session is None:
+            return
+        with self._lock:
+            latest = self._latest.get(session, token)
+        if latest != token:
+            raise Superseded
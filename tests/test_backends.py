@@ -0,0 +1,145 @@
+"""Both query backends must give the same answers for the same filters."""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from backends import DuckDBBackend, PandasBackend
+from data import build_locations, factor_cols, load_crashes, vehicle_cols
+
+BOROUGHS = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", None]
+STREETS = ["BROADWAY", "ATLANTIC AVENUE", "QUEENS BOULEVARD", "3 AVENUE", None]
+FACTORS = ["Unsafe Speed", "Driver Inattention/Distraction", "Backing Unsafely", "Following Too Closely", None]
+TYPES = ["Sedan", "Taxi", "Bike", "Box Truck", "Motorcycle", "PASSENGER VEHICLE", "Bus", None]
+
+GRID = list(itertools.product(
+    [None, ["BROOKLYN"], ["QUEENS", "BRONX"]],
+    [None, [0, 23], [7, 9]],
+    [None, ["car"], ["truck", "other"]],
+    [None, ["Bike"], ["Sedan", "Box Truck"]],
+))
+
+
+def _crashes_csv(path, n=3000, seed=7):
+    rng = np.random.RandomState(seed)
+
+    def pick(values, blank=0.0):
+        out = [values[i] for i in rng.randint(len(values), size=n)]
+        return [None if rng.rand() < blank else v for v in out]
+
+    # Few distinct spots so that locations repeat and hotspots have ties
+    lat = 40.6 + rng.randint(20, size=n) * 0.01
+    lon = -74.0 + rng.randint(20, size=n) * 0.01
+    lat[rng.rand(n) < 0.05] = np.nan
+
+    times = [f"{h}:{m:02d}" for h, m in zip(rng.randint(24, size=n), rng.randint(60, size=n))]
+    times = [t if rng.rand() > 0.02 else "" for t in times]
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.randint(400, size=n), unit="D")
+
+    df = pd.DataFrame({
+        "CRASH DATE": dates.strftime("%m/%d/%Y"),
+        "CRASH TIME": times,
+        "BOROUGH": pick(BOROUGHS),
+        "ZIP CODE": pick(["11201", "11375", "10451", None]),
+        "LATITUDE": lat,
+        "LONGITUDE": lon,
+        "ON STREET NAME": pick(STREETS),
+        "CROSS STREET NAME": pick(STREETS),
+        "OFF STREET NAME": pick([None, "1 MAIN STREET"]),
+        "NUMBER OF PERSONS INJURED": pick([0, 0, 0, 1, 2], blank=0.01),
+        "NUMBER OF PERSONS KILLED": pick([0] * 30 + [1], blank=0.01),
+        "NUMBER OF PEDESTRIANS INJURED": pick([0, 0, 1]),
+        "NUMBER OF PEDESTRIANS KILLED": pick([0]),
+        "NUMBER OF CYCLIST INJURED": pick([0, 0, 1]),
+        "NUMBER OF CYCLIST KILLED": pick([0]),
+        "NUMBER OF MOTORIST INJURED": pick([0, 1]),
+        "NUMBER OF MOTORIST KILLED": pick([0]),
+        **{col: pick(FACTORS, blank=0.3) for col in factor_cols},
+        "COLLISION_ID": np.arange(n),
+        **{col: pick(TYPES, blank=0.2 * i) for i, col in enumerate(vehicle_cols)},
+    })
+    df.to_csv(path, index=False)
+
+
+@pytest.fixture(scope="module")
+def backends(tmp_path_factory):
+    root = tmp_path_factory.mktemp("crashes")
+    csv_path, parquet_path = str(root / "crashes.csv"), str(root / "crashes.parquet")
+    _crashes_csv(csv_path)
+    df = load_crashes(csv_path, parquet_path)
+    locations = build_locations(df)
+    return PandasBackend(df, locations), DuckDBBackend(locations, parquet_path, threads=2)
+
+
+def _assert_same_kpis(a, b):
+    assert a["collisions"] == b["collisions"]
+    assert float(a["injured"]) == float(b["injured"])
+    assert float(a["killed"]) == float(b["killed"])
+    assert a["top_factor"] == b["top_factor"]
+
+
+def _assert_same_frames(a, b, columns):
+    a = a[columns].reset_index(drop=True)
+    b = b[columns].reset_index(drop=True)
+    for col in columns:
+        if a[col].dtype == object or b[col].dtype == object:
+            assert a[col].fillna("").tolist() == b[col].fillna("").tolist(), col
+        else:
+            np.testing.assert_allclose(a[col].to_numpy(dtype=float), b[col].to_numpy(dtype=float), err_msg=col)
+
+
+@pytest.mark.parametrize("filters", GRID)
+def test_selection_aggregates_match(backends, filters):
+    pandas_backend, duckdb_backend = backends
+    a, b = pandas_backend.select(*filters), duckdb_backend.select(*filters)
+
+    _assert_same_kpis(pandas_backend.kpis(a), duckdb_backend.kpis(b))
+    np.testing.assert_array_equal(pandas_backend.hourly_counts(a), duckdb_backend.hourly_counts(b))
+
+    top_a, top_b = pandas_backend.top_factors(a, 5), duckdb_backend.top_factors(b, 5)
+    assert top_a.index.tolist() == top_b.index.tolist()
+    assert top_a.tolist() == top_b.tolist()
+
+    sums_a, sums_b = pandas_backend.borough_sums(a), duckdb_backend.borough_sums(b)
+    _assert_same_frames(sums_a, sums_b, sums_a.columns.tolist())
+
+    hot_a, hot_b = pandas_backend.hotspots(a, 10), duckdb_backend.hotspots(b, 10)
+    _assert_same_frames(hot_a, hot_b, ["LOCATION_ID", "CRASHES", "INJURED", "KILLED", "LOCATION"])
+
+    for window in [(None, None), (18300, 18400)]:
+        for x, y in zip(pandas_backend.daily_counts(a, *window), duckdb_backend.daily_counts(b, *window)):
+            np.testing.assert_allclose(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+
+@pytest.mark.parametrize("filters", GRID[::4])
+def test_refine_matches(backends, filters):
+    pandas_backend, duckdb_backend = backends
+    a, b = pandas_backend.select(*filters), duckdb_backend.select(*filters)
+    for field, value in [("factor", "Unsafe Speed"), ("borough", "BROOKLYN"), ("hour", 8)]:
+        a, b = pandas_backend.refine(a, field, value), duckdb_backend.refine(b, field, value)
+        _assert_same_kpis(pandas_backend.kpis(a), duckdb_backend.kpis(b))
+        np.testing.assert_array_equal(pandas_backend.hourly_counts(a), duckdb_backend.hourly_counts(b))
+
+
+def test_refine_unknown_value_selects_nothing(backends):
+    pandas_backend, duckdb_backend = backends
+    a = pandas_backend.refine(pandas_backend.select(), "borough", "ATLANTIS")
+    b = duckdb_backend.refine(duckdb_backend.select(), "borough", "ATLANTIS")
+    assert pandas_backend.kpis(a)["collisions"] == duckdb_backend.kpis(b)["collisions"] == 0
+
+
+@pytest.mark.parametrize("start", range(0, len(GRID), 6))
+def test_compare_matches_separate_selections(backends, start):
+    scenarios = GRID[start:start + 6]
+    for backend in backends:
+        results = backend.compare(scenarios)
+        for filters, result in zip(scenarios, results):
+            sel = backend.select(*filters)
+            kpis = backend.kpis(sel)
+            assert result["collisions"] == kpis["collisions"]
+            assert float(result["injured"]) == float(kpis["injured"])
+            assert float(result["killed"]) == float(kpis["killed"])
+            np.testing.assert_array_equal(result["hourly"], backend.hourly_counts(sel))